@@ -1,8 +1,14 @@
-from PyQt5.QtWidgets import QDialog, QFileDialog
+import os
+
+from PyQt5.QtWidgets import QDialog, QFileDialog, QApplication
 
 from gui.templates.load_dialog import Ui_load_dialog
+from storage.cache import user_cache_dir
 from storage.warehouse import Warehouse
 
+# snapshot of last loaded warehouse, reused while source files are unchanged
+SNAPSHOT_PATH = os.path.join(user_cache_dir(), 'snapshot.npz')
+
 
 class LoadDialog(QDialog):
 
@@ -30,13 +36,23 @@ class LoadDialog(QDialog):
         #
 
     def _on_submit(self):
+        # events are processed while loading (see _on_progress()), so the load can't be started again meanwhile
+        self.ui.load_button.setEnabled(False)
+        try:
+            self._load()
+        finally:
+            self.ui.load_button.setEnabled(True)
+
+    def _load(self):
         # TODO: handle exceptions
         try:
             self.warehouse = Warehouse()
             self.warehouse.load(
                 self.ui.load_categories_text.text(),
                 self.ui.load_products_text.text(),
-                self.ui.load_operations_text.text()
+                self.ui.load_operations_text.text(),
+                snapshot=SNAPSHOT_PATH,
+                progress=self._on_progress
             )
         except FileNotFoundError as e:
             self.warehouse = None
@@ -48,6 +64,11 @@ class LoadDialog(QDialog):
 
         self.close()
 
+    def _on_progress(self, done: int, total: int):
+        self.ui.load_progress.setValue(int(100 * done / total) if total else 100)
+        # keep dialog responsive while loading
+        QApplication.processEvents()
+
     def _on_products_button(self):
         self.ui.load_products_text.setText(
             QFileDialog.getOpenFileName(self, 'Produkty', self.ui.load_products_text.text(), filter='*.csv')[0]
@@ -11,7 +11,7 @@ from PyQt5 import QtCore, QtGui, QtWidgets
 class Ui_load_dialog(object):
     def setupUi(self, load_dialog):
         load_dialog.setObjectName("load_dialog")
-        load_dialog.resize(429, 159)
+        load_dialog.resize(429, 189)
         self.gridLayout = QtWidgets.QGridLayout(load_dialog)
         self.gridLayout.setObjectName("gridLayout")
         self.load_categories_text = QtWidgets.QLineEdit(load_dialog)
@@ -38,7 +38,7 @@ class Ui_load_dialog(object):
         self.load_button.setStandardButtons(QtWidgets.QDialogButtonBox.Ok)
         self.load_button.setCenterButtons(True)
         self.load_button.setObjectName("load_button")
-        self.gridLayout.addWidget(self.load_button, 4, 0, 1, 3)
+        self.gridLayout.addWidget(self.load_button, 5, 0, 1, 3)
         self.load_operations_text = QtWidgets.QLineEdit(load_dialog)
         self.load_operations_text.setObjectName("load_operations_text")
         self.gridLayout.addWidget(self.load_operations_text, 2, 1, 1, 1)
@@ -52,6 +52,10 @@ class Ui_load_dialog(object):
         self.load_error.setText("")
         self.load_error.setObjectName("load_error")
         self.gridLayout.addWidget(self.load_error, 3, 0, 1, 3)
+        self.load_progress = QtWidgets.QProgressBar(load_dialog)
+        self.load_progress.setProperty("value", 0)
+        self.load_progress.setObjectName("load_progress")
+        self.gridLayout.addWidget(self.load_progress, 4, 0, 1, 3)
 
         self.retranslateUi(load_dialog)
         QtCore.QMetaObject.connectSlotsByName(load_dialog)
@@ -3,13 +3,38 @@ from datetime import date
 from typing import Optional, Dict, List, Tuple
 
 import matplotlib.pyplot as plt
+from PyQt5.QtCore import QThread, pyqtSignal
 from PyQt5.QtGui import QColor
 from PyQt5.QtWidgets import QMainWindow, QFileDialog, QTableWidgetItem
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 
 from gui.templates.main_window import Ui_main_window
 from storage import plots, analysis
-from storage.warehouse import Warehouse, Size, Sex
+from storage.warehouse import Warehouse, Size, Sex, Product
+
+
+class MonthsForSuppliesThread(QThread):
+    """ Fits forecasting models of products outside of UI thread. """
+
+    # statuses of products, months for supplies of each of them
+    done = pyqtSignal(object, object)
+    # error message, emitted instead of done when forecasts couldn't be computed
+    failed = pyqtSignal(str)
+
+    def __init__(self, statuses: Dict[Product, int], warehouse: Warehouse, parent=None) -> None:
+        super().__init__(parent)
+        self.statuses = statuses
+        self.warehouse = warehouse
+
+    def run(self) -> None:
+        # models of all products are fitted in parallel
+        try:
+            months_for_supplies = analysis.get_months_for_supplies_many(
+                [prod.id for prod in self.statuses], list(self.statuses.values()), self.warehouse)
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.done.emit(self.statuses, months_for_supplies)
 
 
 class MainWindow(QMainWindow):
@@ -203,8 +228,8 @@ class MainWindow(QMainWindow):
     def _on_analysis_colors_button(self):
         headers = ['kolor', 'sprzedane sztuki']
 
-        date_from = self.ui.analysis_date_from.date()
-        date_to = self.ui.analysis_date_to.date()
+        date_from = self.ui.analysis_date_from.date().toPyDate()
+        date_to = self.ui.analysis_date_to.date().toPyDate()
 
         if date_to <= date_from:
             self.ui.statusbar.showMessage("[BŁĄD] Data od musi być mniejsza niż data do")
@@ -222,8 +247,8 @@ class MainWindow(QMainWindow):
     def _on_analysis_sizes_button(self):
         headers = ['rozmiar', 'sprzedane sztuki']
 
-        date_from = self.ui.analysis_date_from.date()
-        date_to = self.ui.analysis_date_to.date()
+        date_from = self.ui.analysis_date_from.date().toPyDate()
+        date_to = self.ui.analysis_date_to.date().toPyDate()
 
         if date_to <= date_from:
             self.ui.statusbar.showMessage("[BŁĄD] Data od musi być mniejsza niż data do")
@@ -298,9 +323,19 @@ class MainWindow(QMainWindow):
 
         statuses = analysis.get_statuses(self.warehouse, **options)
 
+        # forecasts may take a while, so they are computed in background
+        self.ui.deliveries_button.setEnabled(False)
+        self.ui.statusbar.showMessage("Prognozowanie sprzedaży...")
+        self.deliveries_thread = MonthsForSuppliesThread(statuses, self.warehouse, self)
+        self.deliveries_thread.done.connect(self._on_deliveries_done)
+        self.deliveries_thread.failed.connect(self._on_deliveries_failed)
+        self.deliveries_thread.start()
+
+    def _on_deliveries_done(self, statuses: Dict[Product, int], months_for_supplies: list):
+        self.ui.deliveries_button.setEnabled(True)
+
         with self.display_table(len(statuses), ['id', 'w magazynie', 'miesiące', 'czas dostawy', 'informacje']):
-            for i, (prod, count) in enumerate(statuses.items()):
-                months = analysis.get_months_for_supplies(prod.id, count, self.warehouse)
+            for i, ((prod, count), months) in enumerate(zip(statuses.items(), months_for_supplies)):
 
                 self.table.setItem(i, 0, QTableWidgetItem(prod.id))
                 self.table.setItem(i, 1, QTableWidgetItem(str(count)))
@@ -313,6 +348,10 @@ class MainWindow(QMainWindow):
 
         self.ui.statusbar.showMessage("Wyświetlono tabelę dostępności")
 
+    def _on_deliveries_failed(self, message: str):
+        self.ui.deliveries_button.setEnabled(True)
+        self.ui.statusbar.showMessage(f"Błąd prognozowania sprzedaży: {message}")
+
     # ========================================================
     #  OPTIONS PARSING
     # ========================================================
@@ -417,7 +456,7 @@ class MainWindow(QMainWindow):
                 self.ui.stock_filters_sizes_text.text() or None,
                 self.ui.stock_filters_sexes_text.text() or None
             )
-            options['time'] = self.ui.stock_date.date()
+            options['time'] = self.ui.stock_date.date().toPyDate()
             return options
         except AssertionError as e:
             self.ui.statusbar.showMessage('[BŁĄD] '+str(e))
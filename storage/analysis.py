@@ -1,13 +1,17 @@
 import csv
+import multiprocessing
+import os
 from collections import defaultdict
 from datetime import date
-from typing import List, Tuple, Dict
+from time import perf_counter, monotonic
+from typing import List, Tuple, Dict, NamedTuple, Optional, Callable
 
 import numpy as np
-from dateutil.relativedelta import relativedelta
 from moneyed import Money, PLN
 
-from storage.warehouse import Warehouse, Product, Operation, OperationType, Category, Size, Sex
+from storage.cache import query_cache, forecast_cache
+from storage.warehouse import Warehouse, Product, Operation, OperationType, Category, Size, Sex, MonthlyRollup, \
+    from_grosze
 
 
 def get_statuses(wh: Warehouse, time: date = None, **kwargs):
@@ -19,10 +23,21 @@ def get_statuses(wh: Warehouse, time: date = None, **kwargs):
     :param kwargs: kryteria przy wybieraniu produktow (patrz get_products())
     :return: ilość produktu w magazynie dla każdego produktu
     """
-    return {
-        prod: stock_status_for_product(prod, wh, time=time)
-        for prod in get_products(wh, **kwargs)
-    }
+    if time is None:
+        time = date.today()
+    return _get_statuses(wh, time, **kwargs)
+
+
+@query_cache.cached
+def _get_statuses(wh: Warehouse, time: date, **kwargs) -> Dict[Product, int]:
+    """ Zwraca status produktow spelniajacych kryteria w danym dniu (patrz get_statuses()). """
+    # stock of all products at once from operations not later than time
+    columns = wh.columns
+    rows = columns.rows_between(0, time.toordinal() + 1)
+    stock = _sum_by(columns.products[rows], columns.signed_quantities(rows), len(wh.product_list))
+
+    selected = select_products(wh, **kwargs)
+    return dict(zip((wh.product_list[i] for i in selected), stock[selected].tolist()))
 
 
 def stock_status_for_product(prod: Product, wh: Warehouse, time: date = None) -> int:
@@ -30,27 +45,44 @@ def stock_status_for_product(prod: Product, wh: Warehouse, time: date = None) ->
     if time is None:
         time = date.today()
 
-    count = 0
-    for operation in get_product_operations(prod, wh):
+    days, stock = wh.stock_timeline(prod.id)
 
-        # skip operations in future
-        if operation.date > time:
-            continue
+    # number of operations not later than time
+    i = np.searchsorted(days, time.toordinal(), side='right')
+    return int(stock[i - 1]) if i else 0
 
-        if operation.type == OperationType.RESUPPLY:
-            count += operation.quantity
-        elif operation.type == OperationType.SALE:
-            count -= operation.quantity
-    return count
+
+def get_statuses_at(dates: List[date], wh: Warehouse, **kwargs) -> Tuple[List[Product], np.ndarray]:
+    """
+    Zwraca status produktow spelniajacych kryteria dla wielu dni naraz.
+
+    :param dates: daty dni dla których jest sprawdzany status
+    :param wh: magazyn
+    :param kwargs: kryteria przy wybieraniu produktow (patrz get_products())
+    :return: produkty oraz macierz (produkty x daty) ilości produktów w magazynie
+    """
+    columns = wh.columns
+    products = select_products(wh, **kwargs)
+    days = np.array([d.toordinal() for d in dates], dtype=np.int64)
+
+    # operation counts for every date which is not before it
+    order = np.argsort(days, kind='stable')
+    first_date = np.searchsorted(days[order], columns.days, side='left')
+
+    # changes of stock per product and first date, summed up along dates
+    changes = np.zeros((len(wh.product_list), len(days) + 1), dtype=np.int64)
+    np.add.at(changes, (columns.products, first_date), columns.signed_quantities(slice(None)))
+    stock = np.cumsum(changes[:, :-1], axis=1)
+
+    # back to order of given dates
+    result = np.empty((len(products), len(days)), dtype=np.int64)
+    result[:, order] = stock[products]
+    return [wh.product_list[i] for i in products], result
 
 
 def get_product_operations(prod: Product, wh: Warehouse) -> List[Operation]:
-    """ Funkcja zwracająca wszytskie operacje dla podanego produktu. """
-    return [
-        op
-        for op in wh.operations.values()
-        if op.product == prod
-    ]
+    """ Funkcja zwracająca wszytskie operacje dla podanego produktu (posortowane po dacie). """
+    return wh.operations_at(wh.product_rows(prod.id))
 
 
 def get_products(wh: Warehouse,
@@ -74,21 +106,119 @@ def get_products(wh: Warehouse,
     :return: produkty które spełniaja podane warunki
     """
 
-    products = wh.products.values()
+    return [wh.product_list[i] for i in select_products(wh, id_prefixes, names, categories, colors, sizes, sexes)]
+
+
+def select_products(wh: Warehouse,
+                    id_prefixes: List[str] = None,
+                    names: List[str] = None,
+                    categories: List[Category] = None,
+                    colors: List[str] = None,
+                    sizes: List[Size] = None,
+                    sexes: List[Sex] = None) -> np.ndarray:
+    """
+    Zwraca posortowane indeksy (w wh.product_list) produktow spełniających podane warunki (patrz get_products()).
+    Warunki sprawdzane są za pomocą indeksów magazynu, zaczynając od najbardziej selektywnego.
+    """
+    # sorted indexes of products meeting each condition
+    selections = []
+    for attribute, values in (('name', names), ('color', colors), ('size', sizes), ('sex', sexes)):
+        if values:
+            if isinstance(values, str):
+                values = [values]
+            index = wh.attribute_index[attribute]
+            selections.append(np.unique(np.concatenate([np.array(index.get(v, []), dtype=np.intp) for v in values])))
     if id_prefixes:
-        products = filter(lambda p: any(p.id.startswith(prefix) for prefix in id_prefixes), products)
-    if names:
-        products = filter(lambda p: p.name in names, products)
-    if colors:
-        products = filter(lambda p: p.color in colors, products)
-    if sizes:
-        products = filter(lambda p: p.size in sizes, products)
-    if sexes:
-        products = filter(lambda p: p.sex in sexes, products)
+        selections.append(wh.products_with_prefixes(id_prefixes))
     if categories:
-        products = filter(lambda p: all(cat in p.all_categories for cat in categories), products)
+        # categories unknown to warehouse can't match any product
+        if any(wh.categories.get(cat.id) != cat for cat in categories):
+            return np.array([], dtype=np.intp)
+        # products having all categories: bitmask of product contains all bits of categories
+        required = wh.categories_mask(categories)
+        selections.append(np.flatnonzero(np.all(wh.product_category_masks() & required == required, axis=1)))
+
+    # intersect starting from the most selective condition
+    selections.sort(key=len)
+    if selections:
+        selected = selections[0]
+        for other in selections[1:]:
+            if not len(selected):
+                break
+            selected = np.intersect1d(selected, other, assume_unique=True)
+    else:
+        selected = np.arange(len(wh.product_list))
+
+    return selected
+
+
+def _sum_by(codes: np.ndarray, values: np.ndarray, size: int) -> np.ndarray:
+    """ Zwraca dokladne (int64) sumy wartosci dla kazdego kodu, odpowiednik np.bincount(codes, values, size) bez bledow float. """
+    sums = np.zeros(size, dtype=np.int64)
+    np.add.at(sums, codes, values)
+    return sums
+
 
-    return list(products)
+def _operations_rows(date_from: date, date_to: date, products: np.ndarray, wh: Warehouse) -> np.ndarray:
+    """ Zwraca wiersze (w wh.columns) operacji z domknięto-otwartego okresu dotyczacych podanych produktow (indeksow). """
+    columns = wh.columns
+
+    # operations are looked up by binary search of date
+    rows = columns.rows_between(date_from.toordinal(), date_to.toordinal())
+
+    # membership of product is a lookup instead of search in list
+    if len(products) < len(wh.product_list):
+        selected = np.zeros(len(wh.product_list), dtype=bool)
+        selected[products] = True
+        rows = rows[selected[columns.products[rows]]]
+
+    return rows
+
+
+class Totals(NamedTuple):
+    """ Podsumowanie operacji w danym okresie. """
+    income: Money
+    costs: Money
+    sales: int
+    resupply: int
+
+    @property
+    def balance(self) -> Money:
+        return self.income - self.costs
+
+    @property
+    def products_balance(self) -> int:
+        return self.resupply - self.sales
+
+
+@query_cache.cached
+def get_totals(date_from: date, date_to: date, wh: Warehouse, **kwargs) -> Totals:
+    """
+    Zwraca przychód, koszty, ilosc sprzedanych i zamowionych towarow na dany domknięto-otwarty okres
+    obliczone jednym przejściem po operacjach.
+
+    :param date_from: data poczatkowa
+    :param date_to: data koncowa
+    :param wh: magazyn
+    :param kwargs: kryteria przy wybieraniu produktow (patrz get_products())
+    :return: podsumowanie operacji za dany okres
+    """
+    columns = wh.columns
+    rows = _operations_rows(date_from, date_to, select_products(wh, **kwargs), wh)
+
+    types = columns.types[rows]
+    quantities = columns.quantities[rows]
+    values = quantities * columns.prices[rows]
+
+    sale = types == OperationType.SALE.value
+    resupply = types == OperationType.RESUPPLY.value
+
+    return Totals(
+        income=from_grosze(values[sale].sum()),
+        costs=from_grosze(values[resupply].sum()),
+        sales=int(quantities[sale].sum()),
+        resupply=int(quantities[resupply].sum())
+    )
 
 
 def get_income(date_from: date, date_to: date, wh: Warehouse, **kwargs) -> Money:
@@ -100,14 +230,7 @@ def get_income(date_from: date, date_to: date, wh: Warehouse, **kwargs) -> Money
     :param kwargs: kryteria przy wybieraniu produktow (patrz get_products())
     :return: suma przychodow za dany okres
     """
-    products = get_products(wh, **kwargs)
-    return sum((
-            op.total_price
-            for op in wh.operations.values()
-            if date_from <= op.date < date_to and op.type == OperationType.SALE and op.product in products
-        ),
-        Money(0, PLN)
-    )
+    return get_totals(date_from, date_to, wh, **kwargs).income
 
 
 def get_costs(date_from: date, date_to: date, wh: Warehouse, **kwargs) -> Money:
@@ -119,14 +242,7 @@ def get_costs(date_from: date, date_to: date, wh: Warehouse, **kwargs) -> Money:
     :param kwargs: kryteria przy wybieraniu produktow (patrz get_products())
     :return: suma kosztow za dany okres
     """
-    products = get_products(wh, **kwargs)
-    return sum((
-            op.total_price
-            for op in wh.operations.values()
-            if date_from <= op.date < date_to and op.type == OperationType.RESUPPLY and op.product in products
-        ),
-        Money(0, PLN)
-    )
+    return get_totals(date_from, date_to, wh, **kwargs).costs
 
 
 def get_sales(date_from: date, date_to: date, wh: Warehouse, **kwargs) -> int:
@@ -139,12 +255,7 @@ def get_sales(date_from: date, date_to: date, wh: Warehouse, **kwargs) -> int:
     :param kwargs: kryteria przy wybieraniu produktow (patrz get_products())
     :return: ilosc sprzedanych towarow za dany okres
     """
-    products = get_products(wh, **kwargs)
-    return sum(
-        op.quantity
-        for op in wh.operations.values()
-        if date_from <= op.date < date_to and op.type == OperationType.SALE and op.product in products
-    )
+    return get_totals(date_from, date_to, wh, **kwargs).sales
 
 
 def get_resupply(date_from: date, date_to: date, wh: Warehouse, **kwargs) -> int:
@@ -156,12 +267,7 @@ def get_resupply(date_from: date, date_to: date, wh: Warehouse, **kwargs) -> int
     :param kwargs: kryteria przy wybieraniu produktow (patrz get_products())
     :return: ilosc zamowionych towarow za dany okres
     """
-    products = get_products(wh, **kwargs)
-    return sum(
-        op.quantity
-        for op in wh.operations.values()
-        if date_from <= op.date < date_to and op.type == OperationType.RESUPPLY and op.product in products
-    )
+    return get_totals(date_from, date_to, wh, **kwargs).resupply
 
 
 def get_balance(date_from: date, date_to: date, wh: Warehouse, **kwargs) -> Money:
@@ -173,7 +279,7 @@ def get_balance(date_from: date, date_to: date, wh: Warehouse, **kwargs) -> Mone
     :param kwargs: kryteria przy wybieraniu produktow (patrz get_products())
     :return: bilans za dany okres
     """
-    return get_income(date_from, date_to, wh, **kwargs) - get_costs(date_from, date_to, wh, **kwargs)
+    return get_totals(date_from, date_to, wh, **kwargs).balance
 
 
 def get_products_balance(date_from: date, date_to: date, wh: Warehouse, **kwargs) -> int:
@@ -185,7 +291,92 @@ def get_products_balance(date_from: date, date_to: date, wh: Warehouse, **kwargs
     :param kwargs: kryteria przy wybieraniu produktow (patrz get_products())
     :return: bilans produktow za dany okres
     """
-    return get_resupply(date_from, date_to, wh, **kwargs) - get_sales(date_from, date_to, wh, **kwargs)
+    return get_totals(date_from, date_to, wh, **kwargs).products_balance
+
+
+GROUP_DIMENSIONS = ('product', 'name', 'color', 'size', 'sex', 'category')
+GROUP_MEASURES = ('quantity', 'income', 'cost', 'margin')
+
+
+def _measure_per_product(measure: str, rows: np.ndarray, wh: Warehouse) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Zwraca wartosc miary (w groszach dla kwot) dla kazdego produktu oraz pierwszy (w kolejnosci wczytania)
+    wiersz operacji wliczanej do miary, len(wh.columns) dla produktow bez takich operacji.
+    """
+    columns = wh.columns
+    types = columns.types[rows]
+    quantities = columns.quantities[rows]
+    sale = types == OperationType.SALE.value
+    resupply = types == OperationType.RESUPPLY.value
+
+    if measure == 'quantity':
+        counted, weights = sale, quantities
+    elif measure == 'income':
+        counted, weights = sale, quantities * columns.prices[rows]
+    elif measure == 'cost':
+        counted, weights = resupply, quantities * columns.prices[rows]
+    elif measure == 'margin':
+        values = quantities * columns.prices[rows]
+        counted, weights = sale | resupply, np.where(sale, values, -values)
+    else:
+        raise ValueError('Unknown measure: {}'.format(measure))
+
+    products = columns.products[rows[counted]]
+    values = _sum_by(products, weights[counted], len(wh.product_list))
+    first_rows = np.full(len(wh.product_list), len(columns))
+    np.minimum.at(first_rows, products, rows[counted])
+    return values, first_rows
+
+
+@query_cache.cached
+def group_by(dimension: str, measure: str, date_from: date, date_to: date, wh: Warehouse,
+             top_k: int = None, **kwargs) -> List[Tuple[object, object]]:
+    """
+    Zwraca wartosc miary w danym domknięto-otwartym okresie dla poszczegolnych wartosci wymiaru,
+    posortowana malejąco (przy rownych wartosciach wczesniej jest wartosc wymiaru, ktorej pierwsza operacja
+    zostala wczytana wczesniej).
+    Pomijane sa wartosci wymiaru bez operacji wliczanych do miary. Produkt nalezy do wszystkich
+    swoich kategorii (wraz z nadrzednymi).
+
+    :param dimension: wymiar, jeden z GROUP_DIMENSIONS: 'product', 'name', 'color', 'size', 'sex', 'category'
+    :param measure: miara, jedna z GROUP_MEASURES: 'quantity' (sprzedane sztuki), 'income', 'cost', 'margin'
+    :param date_from: data poczatkowa
+    :param date_to: data koncowa
+    :param wh: magazyn
+    :param top_k: ilosc zwracanych najlepszych wartosci wymiaru (None - wszystkie)
+    :param kwargs: kryteria przy wybieraniu produktow (patrz get_products())
+    :return: lista tupli w formacie: (wartosc miary, wartosc wymiaru)
+    """
+    if dimension not in GROUP_DIMENSIONS:
+        raise ValueError('Unknown dimension: {}'.format(dimension))
+
+    rows = _operations_rows(date_from, date_to, select_products(wh, **kwargs), wh)
+    values, first_rows = _measure_per_product(measure, rows, wh)
+
+    # pairs (group code, product index), product belongs to many categories
+    if dimension == 'product':
+        keys = wh.product_list
+        codes = products = np.arange(len(keys))
+    else:
+        keys, codes, products = wh.attribute_codes(dimension)
+        if dimension == 'category':
+            keys = [wh.categories[cat_id] for cat_id in keys]
+
+    sums = _sum_by(codes, values[products], len(keys))
+    first = np.full(len(keys), len(wh.columns))
+    np.minimum.at(first, codes, first_rows[products])
+    groups = np.flatnonzero(first < len(wh.columns))
+
+    # only groups not worse than k-th best one have to be sorted
+    if top_k is not None and top_k < len(groups):
+        if top_k <= 0:
+            return []
+        kth = np.partition(sums[groups], len(groups) - top_k)[len(groups) - top_k]
+        groups = groups[sums[groups] >= kth]
+    groups = groups[np.lexsort((first[groups], -sums[groups]))][:top_k]
+
+    to_value = int if measure == 'quantity' else from_grosze
+    return [(to_value(value), keys[g]) for value, g in zip(sums[groups].tolist(), groups.tolist())]
 
 
 def get_best_selling_colors(date_from: date, date_to: date, wh: Warehouse) -> List[Tuple[int, str]]:
@@ -197,14 +388,7 @@ def get_best_selling_colors(date_from: date, date_to: date, wh: Warehouse) -> Li
     :param wh: magazyn
     :return: posortowana lista tupli w formacie: (ilosc, kolor)
     """
-    data = defaultdict(int)
-
-    for op in wh.operations.values():
-        if date_from <= op.date < date_to and op.type == OperationType.SALE:
-            data[op.product.color] += op.quantity
-
-    data = [(count, color) for color, count in data.items()]
-    return sorted(data, reverse=True)
+    return sorted(group_by('color', 'quantity', date_from, date_to, wh), reverse=True)
 
 
 def get_best_selling_sizes(date_from: date, date_to: date, wh: Warehouse) -> List[Tuple[int, Size]]:
@@ -216,14 +400,7 @@ def get_best_selling_sizes(date_from: date, date_to: date, wh: Warehouse) -> Lis
     :param wh: magazyn
     :return: posortowana lista tupli w formacie: (ilosc, rozmiar)
     """
-    data = defaultdict(int)
-
-    for op in wh.operations.values():
-        if date_from <= op.date < date_to and op.type == OperationType.SALE:
-            data[op.product.size] += op.quantity
-
-    data = [(count, size) for size, count in data.items()]
-    return sorted(data, reverse=True, key=lambda x: x[0])
+    return group_by('size', 'quantity', date_from, date_to, wh)
 
 
 def load_stocktaking(path: str) -> Dict[str, int]:
@@ -264,6 +441,13 @@ def compare_with_stocktaking(path: str, wh: Warehouse) -> Dict[Product, int]:
     }
 
 
+def _last_months(months: int) -> Tuple[int, int]:
+    """ Zwraca zakres (w numeracji MonthlyRollup) ostatnich pełnych miesięcy. """
+    today = date.today()
+    current = int(MonthlyRollup.month_of([date(today.year, today.month, 1).toordinal()])[0])
+    return current - max(months, 0), current
+
+
 def get_monthly_incomes(months: int, wh: Warehouse, **kwargs) -> List[Money]:
     """
     Zwraca przychody na przestrzeni ostatnich miesięcy.
@@ -272,11 +456,8 @@ def get_monthly_incomes(months: int, wh: Warehouse, **kwargs) -> List[Money]:
     :param wh: magazyn
     :return: dochody w ostatnich miesiącach
     """
-    d = date(date.today().year, date.today().month, 1)
-    return [
-        get_income(d + relativedelta(months=i), d + relativedelta(months=i+1), wh, **kwargs)
-        for i in range(-months, 0)
-    ]
+    series = wh.monthly.series('income', select_products(wh, **kwargs), *_last_months(months))
+    return [from_grosze(v) for v in series.tolist()]
 
 
 def get_monthly_sales(months: int, wh: Warehouse, **kwargs) -> List[int]:
@@ -287,37 +468,145 @@ def get_monthly_sales(months: int, wh: Warehouse, **kwargs) -> List[int]:
     :param wh: magazyn
     :return: sprzedaże w ostatnich miesiącach
     """
-    d = date(date.today().year, date.today().month, 1)
-    return [
-        get_sales(d + relativedelta(months=i), d + relativedelta(months=i+1), wh, **kwargs)
-        for i in range(-months, 0)
-    ]
+    return wh.monthly.series('sales', select_products(wh, **kwargs), *_last_months(months)).tolist()
+
+
+def _model_keys(data: List[float], order: tuple, seasonal_order: tuple) -> Tuple[tuple, tuple]:
+    """ Zwraca klucze (w forecast_cache) parametrow modelu dla danych: po calych danych i po danych bez pierwszej wartosci. """
+    return ('model', data, order, seasonal_order), ('tail', data[1:], order, seasonal_order)
+
+
+def _warm_start_params(data: List[float], order: tuple, seasonal_order: tuple) -> Optional[List[float]]:
+    """
+    Zwraca parametry modelu dopasowanego wczesniej do danych bez ostatniej wartosci
+    (dane przedluzone o miesiac lub przesuniete o miesiac), albo None.
+    """
+    model_key, _ = _model_keys(data[:-1], order, seasonal_order)
+    for key in (model_key, ('tail',) + model_key[1:]):
+        params = forecast_cache.get(key)
+        if params is not None:
+            return params
+    return None
+
+
+class FitTimeout(Exception):
+    """ Dopasowanie modelu przekroczylo limit czasu (patrz forecast_values()). """
 
 
-def forecast_values(data: List[float], predictions: int, season: int) -> List[float]:
+def forecast_values(data: List[float], predictions: int, season: int, time_limit: float = None,
+                    use_cache: bool = True) -> List[float]:
     from statsmodels.tsa.statespace.sarimax import SARIMAX
 
-    # fit model
+    # optimization is interrupted once time limit (counted from start of this forecast) is exceeded
+    callback = None
+    if time_limit is not None:
+        deadline = perf_counter() + time_limit
+
+        def callback(params):
+            if perf_counter() > deadline:
+                raise FitTimeout()
+
+    data = [float(v) for v in data]
+    order, seasonal_order = (2, 1, 1), (1, 0, 0, season)
+
+    # same data was already forecast (without cache model is always fitted from scratch and not saved)
+    forecast_key = ('forecast', data, order, seasonal_order, predictions)
+    forecast = forecast_cache.get(forecast_key) if use_cache else None
+    if forecast is not None:
+        return forecast
+
+    # fit model, starting from parameters fitted to previous month if possible
     model = SARIMAX(
         data,
-        order=(2, 1, 1),
-        seasonal_order=(1, 0, 0, season),
+        order=order,
+        seasonal_order=seasonal_order,
         enforce_invertibility=False,
         enforce_stationarity=False
     )
-    model_fit = model.fit(disp=False)
+    start_params = _warm_start_params(data, order, seasonal_order) if use_cache else None
+    model_fit = model.fit(start_params=start_params, disp=False, callback=callback)
 
     # make prediction
-    return model_fit.predict(len(data), len(data) + predictions - 1).tolist()
+    forecast = model_fit.predict(len(data), len(data) + predictions - 1).tolist()
 
+    if use_cache:
+        params = model_fit.params.tolist()
+        for key in _model_keys(data, order, seasonal_order):
+            forecast_cache.put(key, params)
+        forecast_cache.put(forecast_key, forecast)
+    return forecast
 
-def get_months_for_supplies(prod_id: str, count: int, wh: Warehouse):
-    data = get_monthly_sales(36, wh, id_prefixes=[prod_id])
+
+def _months_for_supplies(data: List[int], count: int, time_limit: float = None):
+    """ Zwraca ilosc miesiecy, na ktore wystarczy count sztuk przy sprzedazy prognozowanej z danych miesiecznych. """
     try:
-        forecast = np.cumsum(np.rint(forecast_values(data, 6, 12)))
+        forecast = np.cumsum(np.rint(forecast_values(data, 6, 12, time_limit)))
+    except FitTimeout:
+        return 'przekroczono czas'
     except:
         return 'brak danych'
 
     if forecast[-1] <= count:
         return '>6'
     return np.argmax(np.cumsum(forecast) > count)
+
+
+def get_months_for_supplies(prod_id: str, count: int, wh: Warehouse):
+    data = get_monthly_sales(36, wh, id_prefixes=[prod_id])
+    return _months_for_supplies(data, count)
+
+
+def get_months_for_supplies_many(product_ids: List[str], counts: List[int], wh: Warehouse,
+                                 workers: int = None, timeout: float = 60) -> list:
+    """
+    Zwraca wyniki get_months_for_supplies() dla wielu produktow. Sprzedaz miesieczna wszystkich produktow
+    jest pobierana naraz, a modele dopasowywane sa rownolegle w osobnych procesach.
+
+    :param product_ids: id (prefiksy id) produktow
+    :param counts: ilosc sztuk kazdego z produktow
+    :param wh: magazyn
+    :param workers: ilosc procesow (None - ilosc procesorow, 1 - obliczenia w biezacym procesie)
+    :param timeout: limit czasu w sekundach na dopasowanie modelu dla jednego produktu
+    :return: wyniki w kolejnosci produktow, 'przekroczono czas' dla produktow po przekroczeniu limitu
+    """
+    sales = wh.monthly.table('sales', np.arange(len(wh.product_list)), *_last_months(36))
+    series = [sales[wh.products_with_prefixes([prod_id])].sum(axis=0).tolist() for prod_id in product_ids]
+
+    tasks = [(data, count, timeout) for data, count in zip(series, counts)]
+    return map_in_processes(_months_for_supplies, tasks, workers, timeout, 'przekroczono czas')
+
+
+def map_in_processes(func: Callable, tasks: List[tuple], workers: int = None, timeout: float = None,
+                     timed_out=None) -> list:
+    """
+    Zwraca wyniki func(*task) dla kazdego z zadan, liczone rownolegle w osobnych procesach.
+    Zadania powinny same przerywac obliczenia po przekroczeniu limitu czasu (np. forecast_values(time_limit=...)),
+    zadania niezakonczone po wszystkich turach zadan (kazda trwajaca maksymalnie timeout) uznawane sa za zawieszone:
+    ich wynikiem jest timed_out, a procesy sa zabijane.
+
+    :param func: funkcja liczaca wynik zadania (musi dac sie przekazac do innego procesu)
+    :param tasks: argumenty kolejnych zadan
+    :param workers: ilosc procesow (None - ilosc procesorow, 1 - obliczenia w biezacym procesie)
+    :param timeout: maksymalny czas jednego zadania w sekundach (None - bez limitu)
+    :param timed_out: wynik zawieszonych zadan
+    :return: wyniki w kolejnosci zadan
+    """
+    if workers == 1:
+        return [func(*task) for task in tasks]
+
+    workers = workers or os.cpu_count() or 1
+    pool = multiprocessing.Pool(workers)
+    try:
+        results = [pool.apply_async(func, task) for task in tasks]
+        # tasks stop themselves after timeout, so tasks still running after all rounds of them are stuck
+        deadline = None if timeout is None else monotonic() + timeout * (-(-len(tasks) // workers) + 1)
+        for i, result in enumerate(results):
+            try:
+                results[i] = result.get(None if deadline is None else max(deadline - monotonic(), 0))
+            except multiprocessing.TimeoutError:
+                results[i] = timed_out
+    finally:
+        # stuck workers are killed instead of being left in background
+        pool.terminate()
+        pool.join()
+    return results
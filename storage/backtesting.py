@@ -0,0 +1,190 @@
+import time
+from typing import List, Dict, NamedTuple, Tuple
+
+import numpy as np
+
+from storage import analysis
+from storage.cache import forecast_cache
+from storage.predictions import matrix_prediction
+from storage.warehouse import Warehouse, MonthlyRollup
+
+
+class ModelScore(NamedTuple):
+    """ Wyniki modelu w testach wstecznych. """
+    mae: List[float]  # sredni blad bezwzgledny dla kolejnych miesiecy prognozy (1..horizon)
+    mape: List[float]  # sredni bezwzgledny blad procentowy (pomijane miesiace bez sprzedazy)
+    fit_time: float  # sredni czas dopasowania modelu i prognozy w sekundach
+    forecasts: int  # ilosc wykonanych prognoz
+    failures: int  # ilosc prognoz, ktorych nie udalo sie wykonac
+
+
+def _sarimax(history: List[float], first_month: int, horizon: int, time_limit: float = None) -> List[float]:
+    """ Prognoza modelem SARIMAX (patrz analysis.forecast_values()), po przekroczeniu limitu czasu FitTimeout. """
+    # model jest zawsze dopasowywany od nowa, zeby czas dopasowania byl rzeczywisty, a prognozy
+    # testow nie zapelnialy pamieci prognoz
+    return analysis.forecast_values(history, horizon, 12, time_limit, use_cache=False)
+
+
+def _trend_seasonal(history: List[float], first_month: int, horizon: int, additive: bool) -> List[float]:
+    """ Prognoza trendem liniowym ze wskaznikami sezonowosci (patrz predictions.counting_prediction()). """
+    # macierz sprzedazy zaczyna sie od stycznia, szereg czasowy od first_month
+    sales = np.array([[0.] * first_month + list(history)])
+    return matrix_prediction(sales, [first_month], True, additive).prediction[0, :horizon].tolist()
+
+
+# modele trendu ze wskaznikami sezonowosci liczone sa bez optymalizacji, wiec nie potrzebuja limitu czasu
+def _additive(history: List[float], first_month: int, horizon: int, time_limit: float = None) -> List[float]:
+    return _trend_seasonal(history, first_month, horizon, True)
+
+
+def _multiplicative(history: List[float], first_month: int, horizon: int, time_limit: float = None) -> List[float]:
+    return _trend_seasonal(history, first_month, horizon, False)
+
+
+# modele porownywane w testach wstecznych (argumenty: historia, miesiac roku jej poczatku, horyzont, limit czasu)
+MODELS = {
+    'sarimax': _sarimax,
+    'additive': _additive,
+    'multiplicative': _multiplicative,
+}
+
+
+def _backtest_series(series: List[float], first_month: int, horizon: int, min_train: int, step: int,
+                     models: Tuple[str, ...], time_limit: float = None) -> Dict[str, list]:
+    """
+    Zwraca sumy bledow modeli dla jednego szeregu czasowego prognozowanego od kolejnych punktow startowych:
+    [bledy bezwzgledne, bledy procentowe, ilosci bledow procentowych, ilosci prognoz dla kolejnych miesiecy,
+    czas, ilosc prognoz, ilosc nieudanych prognoz]. Prognozy przekraczajace limit czasu sa nieudane.
+    """
+    key = ('backtest', series, first_month, horizon, min_train, step, models, time_limit)
+    cached = forecast_cache.get(key)
+    if cached is not None:
+        return cached
+
+    result = {}
+    for name in models:
+        errors, percentage, percentage_counts, counts = np.zeros((4, horizon))
+        elapsed, forecasts, failures = 0., 0, 0
+        for origin in range(min_train, len(series), step):
+            actual = np.array(series[origin:origin + horizon])
+            start = time.perf_counter()
+            try:
+                forecast = np.array(MODELS[name](series[:origin], first_month, horizon, time_limit),
+                                    dtype=float)[:len(actual)]
+            except Exception:
+                failures += 1
+                continue
+            elapsed += time.perf_counter() - start
+            forecasts += 1
+
+            # nieudane (NaN) prognozy nie sa wliczane do bledow
+            valid = np.isfinite(forecast)
+            steps = np.flatnonzero(valid)
+            errors[steps] += np.abs(forecast - actual)[valid]
+            counts[steps] += 1
+            nonzero = valid & (actual != 0)
+            steps = np.flatnonzero(nonzero)
+            percentage[steps] += np.abs(forecast - actual)[nonzero] / np.abs(actual[nonzero])
+            percentage_counts[steps] += 1
+        result[name] = [errors.tolist(), percentage.tolist(), percentage_counts.tolist(), counts.tolist(),
+                        elapsed, forecasts, failures]
+
+    forecast_cache.put(key, result)
+    return result
+
+
+def backtest_series(wh: Warehouse, by: str = 'product', **kwargs) -> Dict[object, Tuple[List[float], int]]:
+    """
+    Zwraca miesieczne szeregi sprzedazy produktow lub kategorii (od pierwszego miesiaca ze sprzedaza
+    do miesiaca ostatniej operacji) wraz z numerem miesiaca roku (0 - styczen) poczatku szeregu.
+
+    :param wh: magazyn
+    :param by: 'product' - szereg dla kazdego produktu, 'category' - dla kazdej kategorii
+    :param kwargs: kryteria przy wybieraniu produktow (patrz get_products())
+    :return: slownik: produkt/kategoria -> (szereg, miesiac roku)
+    """
+    if by not in ('product', 'category'):
+        raise ValueError('Unknown series: {}'.format(by))
+    selected = analysis.select_products(wh, **kwargs)
+    if not len(wh.columns) or not len(selected):
+        return {}
+
+    first = wh.monthly.first_month
+    last = int(MonthlyRollup.month_of(wh.columns.days.max()))
+    sales = wh.monthly.table('sales', np.arange(len(wh.product_list)), first, last + 1)
+
+    if by == 'product':
+        groups = {wh.product_list[i]: [i] for i in selected.tolist()}
+    else:
+        groups = {
+            wh.categories[cat_id]: np.intersect1d(products, selected)
+            for cat_id, products in wh.attribute_index['category'].items()
+        }
+
+    series = {}
+    for key, products in groups.items():
+        values = sales[products].sum(axis=0)
+        sold = np.flatnonzero(values)
+        if len(sold):
+            series[key] = (values[sold[0]:].tolist(), (first + int(sold[0])) % 12)
+    return series
+
+
+def backtest(wh: Warehouse, by: str = 'product', horizon: int = 6, min_train: int = 24, step: int = 1,
+             models: Tuple[str, ...] = tuple(MODELS), workers: int = None, time_limit: float = 60,
+             **kwargs) -> Dict[str, ModelScore]:
+    """
+    Testy wsteczne modeli prognozy sprzedazy z przesuwanym punktem startowym: kazdy model prognozuje
+    horizon miesiecy na podstawie danych sprzed kolejnych miesiecy kazdego szeregu, a prognozy sa porownywane
+    ze sprzedaza rzeczywista. Szeregi liczone sa rownolegle w osobnych procesach, a wyniki dla szeregow
+    sa zapamietywane na dysku (patrz storage.cache.forecast_cache).
+
+    :param wh: magazyn
+    :param by: 'product' - szeregi sprzedazy produktow, 'category' - kategorii
+    :param horizon: ilosc prognozowanych miesiecy (maksymalnie 12)
+    :param min_train: minimalna ilosc miesiecy danych, na podstawie ktorych prognozujemy
+    :param step: co ile miesiecy przesuwany jest punkt startowy
+    :param models: nazwy porownywanych modeli (patrz MODELS)
+    :param workers: ilosc procesow (None - ilosc procesorow, 1 - obliczenia w biezacym procesie)
+    :param time_limit: limit czasu w sekundach na dopasowanie jednego modelu, dluzsze prognozy sa nieudane
+    :param kwargs: kryteria przy wybieraniu produktow (patrz get_products())
+    :return: wyniki dla kazdego modelu
+    """
+    if not 1 <= horizon <= 12:
+        raise ValueError('Horizon has to be between 1 and 12 months')
+    for name in models:
+        if name not in MODELS:
+            raise ValueError('Unknown model: {}'.format(name))
+    models = tuple(models)
+
+    tasks = [
+        (values, first_month, horizon, min_train, step, models, time_limit)
+        for values, first_month in backtest_series(wh, by, **kwargs).values()
+        if len(values) > min_train
+    ]
+    # prognozy dla kazdego szeregu (modele dla kolejnych punktow startowych)
+    origins = [len(range(min_train, len(task[0]), step)) for task in tasks]
+
+    # szereg jest zawieszony dopiero, gdy przekroczy limity czasu wszystkich swoich prognoz
+    timeout = None if time_limit is None else time_limit * (max(origins, default=0) * len(models) + 1)
+    results = analysis.map_in_processes(_backtest_series, tasks, workers, timeout)
+
+    scores = {}
+    for name in models:
+        totals = [result[name] for result in results if result is not None]
+        errors, percentage, percentage_counts, counts = (
+            np.sum([np.array(total[i]) for total in totals], axis=0) if totals else np.zeros(horizon)
+            for i in range(4)
+        )
+        elapsed, forecasts, failures = (sum(total[i] for total in totals) for i in range(4, 7))
+        # wszystkie prognozy zawieszonych szeregow sa nieudane
+        failures += sum(count for count, result in zip(origins, results) if result is None)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            scores[name] = ModelScore(
+                mae=(errors / counts).tolist(),
+                mape=(percentage / percentage_counts * 100).tolist(),
+                fit_time=elapsed / forecasts if forecasts else 0.,
+                forecasts=forecasts,
+                failures=failures
+            )
+    return scores
@@ -0,0 +1,183 @@
+import copy
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import NamedTuple, Callable, Hashable, Optional
+
+from storage.warehouse import Warehouse
+
+
+def user_cache_dir() -> str:
+    """ Returns directory for cached data of current user (not shared with other users of the system) """
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'warehouse')
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class QueryCache:
+    """
+    Bounded LRU cache of query results.
+    Results are keyed by query, its arguments and version of warehouse, so any change
+    of warehouse (load, append) makes its old results unreachable (they are evicted later).
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+
+    def cached(self, func: Callable) -> Callable:
+        """ Decorator caching results of query function """
+        signature = inspect.signature(func)
+        name = func.__module__ + '.' + func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = (name,) + tuple((arg, _normalize(value)) for arg, value in bound.arguments.items())
+
+            try:
+                result = self._results[key]
+            except (KeyError, TypeError):
+                # unhashable arguments are not cached
+                self.misses += 1
+                result = func(*args, **kwargs)
+                try:
+                    self._store(key, result)
+                except TypeError:
+                    pass
+            else:
+                self.hits += 1
+                self._results.move_to_end(key)
+
+            # results (dicts, lists) may be modified by caller
+            return copy.copy(result)
+
+        return wrapper
+
+    def _store(self, key: Hashable, result):
+        """ Saves result, evicting least recently used ones above maxsize """
+        self._results[key] = result
+        while len(self._results) > self.maxsize:
+            self._results.popitem(last=False)
+
+    def info(self) -> CacheInfo:
+        """ Returns hit/miss statistics and size of cache """
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._results))
+
+    def clear(self):
+        """ Removes all results and resets statistics """
+        self._results.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+class DiskCache:
+    """
+    Cache of JSON values stored as files in directory, shared by processes and program runs.
+    Keys are hashed, so they may be any values with stable repr(). Values saved under other version
+    (or other key with the same hash) are ignored, values older than max_age seconds expire and above
+    maxsize files the oldest ones are evicted.
+    """
+
+    def __init__(self, path: str, version: int = 1, maxsize: int = 10000, max_age: float = 30 * 24 * 3600):
+        self.path = path
+        self.version = version
+        self.maxsize = maxsize
+        self.max_age = max_age
+        self._puts = 0
+
+    def _file(self, key) -> str:
+        return os.path.join(self.path, hashlib.sha1(repr((self.version, key)).encode()).hexdigest() + '.json')
+
+    def get(self, key) -> Optional[object]:
+        """ Returns value saved under key or None """
+        try:
+            with open(self._file(key)) as f:
+                if time.time() - os.fstat(f.fileno()).st_mtime > self.max_age:
+                    return None
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        # file may be left by other version of program or damaged
+        if not isinstance(saved, dict) or saved.get('version') != self.version or saved.get('key') != repr(key):
+            return None
+        return saved.get('value')
+
+    def put(self, key, value):
+        """ Saves value under key, cache which can't be written is silently skipped """
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            # value is written to temporary file first, so readers never see partially written one
+            fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'version': self.version, 'key': repr(key), 'value': value}, f)
+            os.replace(tmp, self._file(key))
+        except OSError:
+            return
+
+        # size is checked only from time to time, as it requires listing the directory
+        self._puts += 1
+        if self._puts % 100 == 0:
+            self.prune()
+
+    def prune(self):
+        """ Removes expired values and the oldest ones above maxsize """
+        try:
+            entries = [entry for entry in os.scandir(self.path) if entry.name.endswith('.json')]
+            modified = [(entry.stat().st_mtime, entry.path) for entry in entries]
+        except OSError:
+            return
+
+        modified.sort(reverse=True)
+        now = time.time()
+        for i, (mtime, path) in enumerate(modified):
+            if i >= self.maxsize or now - mtime > self.max_age:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def clear(self):
+        """ Removes all saved values """
+        if os.path.isdir(self.path):
+            for name in os.listdir(self.path):
+                if name.endswith(('.json', '.tmp')):
+                    os.remove(os.path.join(self.path, name))
+
+
+def _normalize(value) -> Hashable:
+    """ Converts query argument to hashable key, filters differing only in order of values are equal """
+    if isinstance(value, Warehouse):
+        return Warehouse, value.version
+    if isinstance(value, dict):
+        return frozenset((k, _normalize(v)) for k, v in value.items())
+    if isinstance(value, (list, set, frozenset)):
+        # empty filter means no filter
+        return frozenset(_normalize(v) for v in value) if value else None
+    # tuples (e.g. Category, Product) are values, order of their fields matters
+    return value
+
+
+# cache of analysis queries
+query_cache = QueryCache()
+
+# fitted forecasting models (see analysis.forecast_values()), cleared with forecast_cache.clear()
+forecast_cache = DiskCache(os.path.join(user_cache_dir(), 'forecasts'))
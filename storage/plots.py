@@ -152,9 +152,10 @@ def plot_yearly_balance(year_from: int, year_to: int, wh: Warehouse):
     """ Wyświetla wykres kosztow i dochodów na przestrzeni lat """
 
     years = list(range(year_from, year_to + 1))
-    costs = [analysis.get_costs(date(y, 1, 1), date(y + 1, 1, 1), wh).amount for y in years]
-    incomes = [analysis.get_income(date(y, 1, 1), date(y + 1, 1, 1), wh).amount for y in years]
-    balance = [analysis.get_balance(date(y, 1, 1), date(y + 1, 1, 1), wh).amount for y in years]
+    totals = [analysis.get_totals(date(y, 1, 1), date(y + 1, 1, 1), wh) for y in years]
+    costs = [t.costs.amount for t in totals]
+    incomes = [t.income.amount for t in totals]
+    balance = [t.balance.amount for t in totals]
 
     plt.plot(years, costs, c='r', label='Koszty')
     plt.plot(years, incomes, c='g', label='Przychody')
@@ -170,9 +171,10 @@ def plot_yearly_products_balance(year_from: int, year_to: int, wh: Warehouse):
     """ Wyświetla wykres dostaw i sprzedazy na przestrzeni lat """
 
     years = list(range(year_from, year_to+1))
-    sales = [analysis.get_sales(date(y, 1, 1), date(y+1, 1, 1), wh) for y in years]
-    resupply = [analysis.get_resupply(date(y, 1, 1), date(y+1, 1, 1), wh) for y in years]
-    balance = [analysis.get_products_balance(date(y, 1, 1), date(y+1, 1, 1), wh) for y in years]
+    totals = [analysis.get_totals(date(y, 1, 1), date(y+1, 1, 1), wh) for y in years]
+    sales = [t.sales for t in totals]
+    resupply = [t.resupply for t in totals]
+    balance = [t.products_balance for t in totals]
 
     plt.plot(years, sales, c='r', label='Sprzedaż')
     plt.plot(years, resupply, c='g', label='Dostawy')
@@ -1,7 +1,9 @@
-from typing import List, Dict
-from storage.warehouse import Warehouse, Product, Operation, OperationType
+from typing import List, Dict, NamedTuple
+from storage.warehouse import Warehouse, Product, Operation, MonthlyRollup
 import matplotlib.pyplot as plt
+import numpy as np
 import statistics as st
+from storage.cache import query_cache
 
 
 """ Czesci skladowe na funkcje prognozy """
@@ -12,119 +14,75 @@ def only_sales_for_product(wh: Warehouse, product_name: str):
     # wh - magazyn, z ktorego pobieramy operacje
     # product_name - id produktu, dla ktorego sprzedaze badamy; jesli nie interesuje nas konkretny produkt, tylko
     # wszystko, wpisujemy w to miejsce None
-    operations_sales = []  # pusta lista operacji dot. sprzedazy
-    values = list(wh.operations.values())  # lista pobranych wartosci z operacji
-    for v in values:  # wypelniamy liste
-        if product_name is None:  # jesli None, to dodajemy wszystkie operacje typu Sale
-            if v.type == OperationType.SALE:
-                operations_sales.append(v)
-        else:  # dodajemy operacje jednoczescnie typu Sale i dot. konkretnego produktu
-            if v.type == OperationType.SALE and v.product.id == product_name:
-                operations_sales.append(v)
-    return operations_sales
+    # operacje sa tworzone dopiero przy odczycie z indeksu sprzedazy magazynu (posortowanego po dacie)
+    return wh.operations_view(wh.sale_rows(product_name))
 
 
+def periods_of(days: np.ndarray, monthly: bool) -> np.ndarray:
+    """ Funkcja zamieniajaca daty (ordinal) na numery miesiecy/kwartalow liczone od stycznia 1970 """
+    months = MonthlyRollup.month_of(days)
+    return months if monthly else months // 3
+
+
+def period_label(period: int, monthly: bool) -> str:
+    """ Identyfikator okresu (numeru z periods_of()) w postaci "3_17" / "II_17" """
+    if monthly:
+        year, month = divmod(period, 12)
+        return str(month + 1) + "_" + str(1970 + year)[-2:]
+    year, quarter = divmod(period, 4)
+    return ["I", "II", "III", "IV"][quarter] + "_" + str(1970 + year)[-2:]
+
+
+def period_sums(wh: Warehouse, product_name, only_quantities: bool, monthly: bool):
+    """ Funkcja sumujaca sprzedaz w kolejnych okresach jednym przejsciem po operacjach """
+    # zwraca numer pierwszego okresu (z pierwsza sprzedaza), sumy sprzedazy oraz ilosci operacji sprzedazy w kolejnych
+    # okresach az do okresu ostatniej operacji w magazynie; kolejnosc operacji w magazynie nie ma znaczenia
+    columns = wh.columns
+    rows = wh.sale_rows(product_name)
+    if not len(rows):
+        raise IndexError('No sales of product {}'.format(product_name))
+    periods = periods_of(columns.days[rows], monthly)
+    first = int(periods.min())
+    last = int(periods_of(columns.days.max(), monthly))  # prognozujemy do ostatniego okresu w ogole
+    periods -= first
+
+    counts = np.bincount(periods, minlength=last - first + 1)
+    if only_quantities:
+        sums = np.zeros(last - first + 1, dtype=np.int64)
+        np.add.at(sums, periods, columns.quantities[rows])
+    else:
+        sums = np.bincount(periods, weights=columns.quantities[rows] * (columns.prices[rows] / 100),
+                           minlength=last - first + 1)
+    return first, sums, counts
+
+
+@query_cache.cached
 def sales_sum(wh: Warehouse, product_name, only_quantities: bool, monthly: bool):
     """ Sumujemy ilosci sprzedanych produktow w kazdym okresie; tworzymy dane historyczne """
     # only_quantities: True - prognoza tylko dla ilosci sprzedanych produktow; False - prognoze sprzedazy (ilosc*cena)
     # monthly: True - sezonowosc miesieczna; False - sezonowosc kwartalna
-    time_series = only_sales_for_product(wh, product_name)  # szereg czasowy sprzedazy
-    keys_list = []  # lista identyfikatorow dla sprzedazy w poszczegolnych okresach
-    sums_list = []  # lista wielkosci sprzedazy w poszczegolnych okresach
-    sales = {}  # slownik dla wielkosci sprzedazy
-    # uniwersalizacja danych
-    whole_data = list(wh.operations.values())
-    begin_year = time_series[0].date.year
-    begin_month = time_series[0].date.month
-    # do prognozy brane beda pod uwage okresy, odkad zaczelismy sprzedarz produktu (pierwszy rok/miesiac w szeregu cz.)
-    # ten punkt do przemyslenia; potrzeba konsultacji
-    end_year = whole_data[-1].date.year
-    end_month = whole_data[-1].date.month
-    # prognozujemy do ostatniego mierzonego w ogole okresu, nawet jezeli nie bylo wtedy zadnej sprzedazy
-    if 1 <= begin_month <= 3:
-        begin_quarter = 1
-    elif 4 <= begin_month <= 6:
-        begin_quarter = 2
-    elif 7 <= begin_month <= 9:
-        begin_quarter = 3
-    else:
-        begin_quarter = 4
-    # do jakiego kwartalu nalezy pierwszy miesiac szeregu czasowego
-    how_many_years = end_year - begin_year + 1
-    # liczba lat dla danych historycznych
-    if monthly == True:  # liczba okresow w ciagu roku
-        k = 12
-    else:
-        k = 4
-    for i in range(0, how_many_years):  # petla reprezentujaca kolejne lata
-        for j in range(0, 12):  # petla reprezentujaca kolejne miesiace
-            sum = 0
-            year = begin_year + i  # rok dla iteracji i
-            month = j + 1  # miesiac dla iteracji j
-            if 1 <= month <= 3:  # kwartal dla kolejnych trzech iteracji j
-                quarter = "I"
-                quarter_to_compare = 1
-            elif 4 <= month <= 6:
-                quarter = "II"
-                quarter_to_compare = 2
-            elif 7 <= month <= 9:
-                quarter = "III"
-                quarter_to_compare = 3
-            else:
-                quarter = "IV"
-                quarter_to_compare = 4  # zmienna pomocnicza
-            if year == end_year and month > end_month:
-                # przerywamy petle, gdy dojdziemy do ostatniego badanego miesiaca
-                break
-            if k == 4:
-                if year == begin_year and quarter_to_compare < begin_quarter:
-                    # petla pomija nastepne kroki, jezeli nie dojdziemy do pierwszego kwartalu szeregu czasowego
-                    continue
-                key = quarter + "_" + str(year)[-2:]  # postac identyfikatora welkosci sprzedarzy dla roku i kwartalu
-            else:
-                if year == begin_year and month < begin_month:
-                    # petla pomija nastepne kroki, jezeli nie dojdziemy do pierwszego miesiaca szeregu czasowego
-                    continue
-                key = str(month) + "_" + str(year)[-2:]  # postac identyfikatora welkosci sprzedarzy dla roku i miesiaca
-            keys_list.append(key)
-            if len(keys_list) > 1 and keys_list[-1] == keys_list[-2]:
-                keys_list.remove(key)  # jesli id sie powtarza, to go usuwamy (zdarza sie dla sez. kwartalnej)
-            if k == 12:
-                for t in time_series:
-                    # sumowanie sprzedarzy zgodnie z danym rokiem i miesiacem
-                    if t.date.year == year and t.date.month == month:
-                        if only_quantities == True:
-                            sum += t.quantity
-                        else:
-                            whole_sale = t.quantity * float(t.price.amount)
-                            sum += whole_sale
-                    # jesli program przejdzie do operacji dotyczacych nastepnego miesiaca/roku, to przerywamy petle
-                    if t.date.year > year or (t.date.year == year and t.date.month > month):
-                        break
-                sums_list.append(sum)
-            else:
-                if month == 1 or month == 4 or month == 7 or month == 10:
-                    # liczymy sumy, gdy month odpowiada pierwszemu miesiacowi w kwartale
-                    for t in time_series:
-                        # sumowanie sprzedarzy zgodnie z danym rokiem i kwartalem
-                        if t.date.year == year and month <= t.date.month <= month + 2:
-                            if only_quantities == True:
-                                sum += t.quantity
-                            else:
-                                whole_sale = t.quantity * float(t.price.amount)
-                                sum += whole_sale
-                        # jesli program przejdzie do operacji dotyczacych nastepnego kwartalu/roku, to przerywamy petle
-                        if t.date.year > year or (t.date.year == year and t.date.month > month + 2):
-                            break
-                    sums_list.append(sum)
-    for i in range(0, len(sums_list)):
-        sales[keys_list[i]] = sums_list[i]
-    return sales
+    # do prognozy brane sa pod uwage okresy od pierwszej sprzedazy produktu do ostatniego mierzonego w ogole okresu,
+    # nawet jezeli nie bylo wtedy zadnej sprzedazy
+    first, sums, counts = period_sums(wh, product_name, only_quantities, monthly)
+    labels = [period_label(period, monthly) for period in range(first, first + len(sums))]
+    return dict(zip(labels, _period_values(sums, counts, only_quantities)))
+
+
+def _period_values(sums: np.ndarray, counts: np.ndarray, only_quantities: bool) -> list:
+    """ Wartosci sprzedazy w okresach z wynikow period_sums() """
+    if only_quantities:
+        return sums.tolist()
+    # okresy bez sprzedazy maja wartosc 0
+    return [value if count else 0 for value, count in zip(sums.tolist(), counts.tolist())]
 
 
 def linear_trend_parameters(wh: Warehouse, product_name, only_quantities: bool, monthly: bool):
     """ Funkcja obliczajaca parametry funkcji trendu liniowego """
-    sales_dict = sales_sum(wh, product_name, only_quantities, monthly)  # dane historyczne
+    return _trend_parameters(sales_sum(wh, product_name, only_quantities, monthly))  # dane historyczne
+
+
+def _trend_parameters(sales_dict: Dict[str, float]) -> List[float]:
+    """ Parametry funkcji trendu liniowego dla danych historycznych """
     t = []  # nr-y operacji od 1 do len(sales_dict)
     y = list(sales_dict.values())  # pobrane wartosci danych historycznych
     # wypelniamy liste t
@@ -156,13 +114,17 @@ def linear_trend_parameters(wh: Warehouse, product_name, only_quantities: bool,
 def seasonal_indicators_intro(wh: Warehouse, product_name, only_quantities: bool, monthly: bool, additive: bool):
     """ Funkcja liczaca wskazniki sezonowosci dla poszczegolnych okresow"""
     # additive: True - model addytywny; False - model multiplikatywny
-    first_indicators = {}  # zbior wskaznikow
     sales_dict = sales_sum(wh, product_name, only_quantities, monthly)  # dane historyczne
+    return _first_indicators(sales_dict, _trend_parameters(sales_dict), additive)
+
+
+def _first_indicators(sales_dict: Dict[str, float], parameters: List[float], additive: bool) -> Dict[str, float]:
+    """ Wskazniki sezonowosci dla poszczegolnych okresow danych historycznych """
+    first_indicators = {}  # zbior wskaznikow
     t = []  # # nr-y operacji od 1 do len(sales_dict)
     t_labels = list(sales_dict)  # identyfikatory danych historycznych
     y_real = list(sales_dict.values())  # wartosci danych historycznych; rzeczywiste wartosci sprzedazy
     y_trend = []  # teoretyczne wartosci sprzedazy wg funkcji trendu
-    parameters = linear_trend_parameters(wh, product_name, only_quantities, monthly)  # parametry funkcji trendu
     a = parameters[0]
     b = parameters[1]
     # wypelnianie listy t
@@ -195,7 +157,11 @@ def seasonal_indicators_intro(wh: Warehouse, product_name, only_quantities: bool
 
 def cleaning_indicators(wh: Warehouse, product_name, only_quantities: bool, monthly: bool, additive: bool):
     """ Funkcja obliczajaca wskazniki surowe i oczyszczone """
-    first_indicators = seasonal_indicators_intro(wh, product_name, only_quantities, monthly, additive)  # zbior wsk.
+    return dict(_seasonal_decomposition(wh, product_name, only_quantities, monthly, additive).indicators)
+
+
+def _cleaned_indicators(first_indicators: Dict[str, float], monthly: bool, additive: bool) -> Dict[str, float]:
+    """ Wskazniki oczyszczone obliczone ze wskaznikow dla poszczegolnych okresow """
     fi_names = list(first_indicators)  # id wskaznikow
     fi_values = list(first_indicators.values())  # wartosci wskaznikow
     # wskazniki surowe
@@ -280,20 +246,23 @@ def cleaning_indicators(wh: Warehouse, product_name, only_quantities: bool, mont
 
 def counting_prediction(wh: Warehouse, product_name, only_quantities: bool, monthly: bool, additive: bool):
     """ Funkcja obliczajaca prognoze na nastepne 12 miesiecy / 4 kwartaly """
-    sales = sales_sum(wh, product_name, only_quantities, monthly)  # dane historyczne
-    parameters = linear_trend_parameters(wh, product_name, only_quantities, monthly)  # parametry funkcji trendu
+    return dict(_seasonal_decomposition(wh, product_name, only_quantities, monthly, additive).prediction)
+
+
+def _prediction(last_label: str, num_of_operations: int, parameters: List[float], indicators: Dict[str, float],
+                monthly: bool, additive: bool) -> Dict[str, float]:
+    """ Prognoza na nastepne 12 miesiecy / 4 kwartaly po ostatnim okresie danych historycznych """
+    # last_label - identyfikator ostatniego okresu; num_of_operations - ile mamy danych historycznych
     a = parameters[0]
     b = parameters[1]
-    indicators = cleaning_indicators(wh, product_name, only_quantities, monthly, additive)  # wskazniki oczyszczone
     labels = []  # identyfikatory dla prognozowanych wartosci
     predicted_values = []  # zbior prognozowanych wartosci
     complete_prediction = {}  # slownik zbudowany z dwoch poprzednich list
-    num_of_operations = len(sales)  # ile mamy danych historycznych
     # jaki byl rok dla ostatniej wartosci historycznej
-    last_year = int(list(sales)[-1][-2:])
+    last_year = int(last_label[-2:])
     if monthly == True:
         k = 12
-        last_month = int(list(sales)[-1][:-3])  # jaki byl ostatni miesiac dla ostatniej wartosci historycznej
+        last_month = int(last_label[:-3])  # jaki byl ostatni miesiac dla ostatniej wartosci historycznej
         # tworzenie id dla prognoz
         for j in range(0, k):
             last_month += 1
@@ -304,7 +273,7 @@ def counting_prediction(wh: Warehouse, product_name, only_quantities: bool, mont
             labels.append(new_label)
     else:
         k = 4
-        last_quarter = list(sales)[-1][:-3]  # jaki byl ostatni kwartal dla ostatniej wartosci historycznej
+        last_quarter = last_label[:-3]  # jaki byl ostatni kwartal dla ostatniej wartosci historycznej
         for j in range(0, k):
             if last_quarter == "I":
                 next_quarter = "II"  # kwartal po poprzednim
@@ -371,14 +340,234 @@ def counting_prediction(wh: Warehouse, product_name, only_quantities: bool, mont
     return complete_prediction
 
 
+class SeasonalDecomposition(NamedTuple):
+    """ Dane historyczne produktu rozlozone na trend i wahania sezonowe wraz z prognoza """
+    sales: Dict[str, float]  # dane historyczne
+    trend: List[float]  # parametry funkcji trendu [a, b]
+    first_indicators: Dict[str, float]  # wskazniki dla poszczegolnych okresow
+    indicators: Dict[str, float]  # wskazniki oczyszczone
+    prediction: Dict[str, float]  # prognoza na nastepne 12 miesiecy / 4 kwartaly
+
+
+def seasonal_decomposition(wh: Warehouse, product_name, only_quantities: bool, monthly: bool,
+                           additive: bool) -> SeasonalDecomposition:
+    """ Funkcja liczaca naraz wszystkie czesci skladowe prognozy; wynik jest pamietany do zmiany magazynu """
+    decomposition = _seasonal_decomposition(wh, product_name, only_quantities, monthly, additive)
+    # zapamietany wynik jest wspoldzielony, wiec zwracamy kopie list i slownikow
+    return SeasonalDecomposition(*(type(part)(part) for part in decomposition))
+
+
+@query_cache.cached
+def _seasonal_decomposition(wh: Warehouse, product_name, only_quantities: bool, monthly: bool,
+                            additive: bool) -> SeasonalDecomposition:
+    """ Czesci skladowe prognozy (patrz seasonal_decomposition()); wyniku nie nalezy modyfikowac """
+    sales = sales_sum(wh, product_name, only_quantities, monthly)  # dane historyczne (jedno przejscie po operacjach)
+    trend = _trend_parameters(sales)
+    first_indicators = _first_indicators(sales, trend, additive)
+    indicators = _cleaned_indicators(first_indicators, monthly, additive)
+    prediction = _prediction(list(sales)[-1], len(sales), trend, indicators, monthly, additive)
+    return SeasonalDecomposition(sales, trend, first_indicators, indicators, prediction)
+
+
+""" Prognoza aktualizowana o kolejne okresy """
+
+
+class OnlineForecaster:
+    """ Stan prognozy produktu aktualizowany w czasie O(1) o kolejne okresy dzieki sumom zamiast danych historycznych """
+
+    def __init__(self, first_period: int, monthly: bool):
+        # first_period - numer pierwszego okresu szeregu czasowego (patrz periods_of())
+        self.first_period = first_period
+        self.monthly = monthly
+        self.k = 12 if monthly else 4
+        # sumy dla funkcji trendu: n, suma t, suma y, suma t*y, suma t^2
+        self.n = 0
+        self.sum_t = 0
+        self.sum_y = 0
+        self.sum_ty = 0
+        self.sum_tt = 0
+        # sumy y i t oraz ilosci danych dla kolejnych miesiecy/kwartalow roku
+        self.season_y = [0] * self.k
+        self.season_t = [0] * self.k
+        self.season_n = [0] * self.k
+        self.values = []  # dane historyczne (potrzebne tylko w modelu multiplikatywnym)
+
+    @classmethod
+    def from_warehouse(cls, wh: Warehouse, product_name, only_quantities: bool, monthly: bool) -> 'OnlineForecaster':
+        """ Tworzy stan z danych historycznych produktu (jak w sales_sum) """
+        first, sums, counts = period_sums(wh, product_name, only_quantities, monthly)
+        forecaster = cls(first, monthly)
+        for y in _period_values(sums, counts, only_quantities):
+            forecaster.add(y)
+        return forecaster
+
+    def add(self, y: float):
+        """ Dodaje sprzedaz w kolejnym okresie """
+        self.n += 1
+        self.values.append(y)
+        self._count(self.n, y, 1)
+
+    def update(self, y: float):
+        """ Zmienia sprzedaz w ostatnim okresie (np. po nowej sprzedazy w biezacym miesiacu) """
+        self._count(self.n, self.values[-1], -1)
+        self.values[-1] = y
+        self._count(self.n, y, 1)
+
+    def _count(self, t: int, y: float, sign: int):
+        """ Dolicza (sign = 1) lub odejmuje (sign = -1) wartosc y okresu t od sum """
+        self.sum_t += sign * t
+        self.sum_y += sign * y
+        self.sum_ty += sign * t * y
+        self.sum_tt += sign * t * t
+        season = (self.first_period + t - 1) % self.k
+        self.season_y[season] += sign * y
+        self.season_t[season] += sign * t
+        self.season_n[season] += sign
+
+    def trend_parameters(self) -> List[float]:
+        """ Parametry funkcji trendu liniowego [a, b] (jak w linear_trend_parameters) """
+        a = (self.n * self.sum_ty - self.sum_t * self.sum_y) / (self.n * self.sum_tt - self.sum_t ** 2)
+        b = (self.sum_y - a * self.sum_t) / self.n
+        return [a, b]
+
+    def cleaning_indicators(self, additive: bool) -> Dict[str, float]:
+        """ Wskazniki oczyszczone (jak w cleaning_indicators) """
+        a, b = self.trend_parameters()
+        if additive:
+            # suma (y - a*t - b) dla miesiaca/kwartalu wynika z sum y i t
+            strict_indicators = [
+                (self.season_y[i] - a * self.season_t[i] - b * self.season_n[i]) / self.season_n[i]
+                for i in range(self.k)
+            ]
+        else:
+            # ilorazy y / (a*t + b) nie daja sie sumowac przyrostowo, potrzebne jest przejscie po danych
+            sums = [0] * self.k
+            for t, y in enumerate(self.values, 1):
+                sums[(self.first_period + t - 1) % self.k] += y / (a * t + b)
+            strict_indicators = [sums[i] / self.season_n[i] for i in range(self.k)]
+
+        main_mean = st.mean(strict_indicators)  # srednia wskaznikow surowych
+        return {
+            "s" + str(i + 1): indicator - main_mean if additive else indicator / main_mean
+            for i, indicator in enumerate(strict_indicators)
+        }
+
+    def prediction(self, additive: bool) -> Dict[str, float]:
+        """ Prognoza na nastepne 12 miesiecy / 4 kwartaly (jak w counting_prediction) """
+        last_label = period_label(self.first_period + self.n - 1, self.monthly)
+        return _prediction(last_label, self.n, self.trend_parameters(), self.cleaning_indicators(additive),
+                           self.monthly, additive)
+
+
+""" Prognoza dla wielu produktow naraz """
+
+
+class MatrixForecast(NamedTuple):
+    """ Wyniki prognozy dla macierzy sprzedazy produkty x okresy (wiersze w kolejnosci produktow) """
+    trend: np.ndarray  # parametry funkcji trendu [a, b] dla kazdego produktu
+    strict_indicators: np.ndarray  # wskazniki surowe dla kolejnych miesiecy/kwartalow roku
+    indicators: np.ndarray  # wskazniki oczyszczone
+    prediction: np.ndarray  # prognoza na nastepne 12 miesiecy / 4 kwartaly
+    labels: List[str]  # identyfikatory prognozowanych okresow (jak w counting_prediction)
+
+
+def sales_matrix(wh: Warehouse, product_names: List[str], only_quantities: bool, monthly: bool):
+    """ Funkcja tworzaca dane historyczne (jak w sales_sum) dla wielu produktow naraz """
+    # zwraca macierz produkty x okresy, kolumna 0 to styczen / I kwartal pierwszego roku sprzedazy,
+    # ostatnia kolumna to okres ostatniej operacji w magazynie; starts - kolumna, od ktorej zaczyna sie
+    # szereg czasowy produktu (pierwsza sprzedaz); last_period - identyfikator ostatniego okresu
+    columns = wh.columns
+    k = 12 if monthly else 4
+    position = np.full(len(wh.product_list), -1)  # wiersz macierzy dla kazdego produktu magazynu
+    position[[wh.product_index[name] for name in product_names]] = np.arange(len(product_names))
+
+    rows = wh.sale_rows()
+    rows = rows[position[columns.products[rows]] >= 0]
+    periods = periods_of(columns.days[rows], monthly)
+    last = int(periods_of(columns.days.max(), monthly))  # prognozujemy od ostatniego okresu w ogole
+    first = (int(periods.min()) // k * k) if len(periods) else last // k * k
+
+    if only_quantities:
+        values = columns.quantities[rows].astype(float)
+    else:
+        values = columns.quantities[rows] * (columns.prices[rows] / 100)
+    sales = np.zeros((len(product_names), last - first + 1))
+    np.add.at(sales, (position[columns.products[rows]], periods - first), values)
+    starts = np.full(len(product_names), last - first + 1)
+    np.minimum.at(starts, position[columns.products[rows]], periods - first)
+
+    return sales, starts, period_label(last, monthly)
+
+
+def matrix_prediction(sales: np.ndarray, starts: np.ndarray, monthly: bool, additive: bool,
+                      last_period: str = None) -> MatrixForecast:
+    """ Funkcja obliczajaca trend, wskazniki sezonowosci i prognoze dla wszystkich wierszy macierzy sprzedazy """
+    # sales - macierz produkty x okresy, kolumna 0 to styczen / I kwartal; starts - pierwsza kolumna szeregu
+    # czasowego kazdego produktu (wczesniejsze kolumny sa pomijane); wszystkie szeregi koncza sie w ostatniej kolumnie
+    k = 12 if monthly else 4
+    count, length = sales.shape
+    starts = np.asarray(starts).reshape(-1, 1)
+    valid = np.arange(length) >= starts  # okresy nalezace do szeregu czasowego produktu
+    n = length - starts[:, 0]  # ilosc danych historycznych
+
+    # parametry funkcji trendu metoda najmniejszych kwadratow, t = 1..n dla kazdego produktu
+    t = np.arange(1, length + 1) - starts
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_t = (n + 1) / 2
+        mean_y = np.where(valid, sales, 0).sum(axis=1) / n
+        dif_t = np.where(valid, t - mean_t[:, None], 0)
+        a = (dif_t * (sales - mean_y[:, None])).sum(axis=1) / (dif_t ** 2).sum(axis=1)
+        b = mean_y - a * mean_t
+
+        # wskazniki dla poszczegolnych okresow, poza szeregiem czasowym NaN
+        y_trend = a[:, None] * t + b[:, None]
+        first = sales - y_trend if additive else sales / y_trend
+        first = np.where(valid, first, np.nan)
+
+        # wskazniki surowe - srednie dla kolejnych miesiecy/kwartalow roku (kolumny uzupelnione do pelnych lat)
+        years = -(-length // k)
+        first = np.pad(first, ((0, 0), (0, years * k - length)), constant_values=np.nan).reshape(count, years, k)
+        strict = np.nansum(first, axis=1) / (~np.isnan(first)).sum(axis=1)
+
+        # wskazniki oczyszczone
+        main_mean = strict.mean(axis=1, keepdims=True)
+        indicators = strict - main_mean if additive else strict / main_mean
+
+        # prognoza na nastepne k okresow
+        future = np.arange(length, length + k)
+        y = a[:, None] * (n[:, None] + np.arange(1, k + 1)) + b[:, None]
+        fluctuations = indicators[:, future % k]
+        prediction = y + fluctuations if additive else y * fluctuations
+        prediction = np.where(prediction < 0, 0, prediction)  # jesli prognoza wyjdzie ujemna, podstawiamy 0
+
+    # identyfikatory prognozowanych okresow
+    labels = []
+    if last_period is not None:
+        names = [str(i) for i in range(1, 13)] if monthly else ["I", "II", "III", "IV"]
+        year = int(last_period[-2:])
+        for i in future:
+            if i % k == 0:
+                year += 1
+            labels.append(names[i % k] + "_" + str(year))
+    return MatrixForecast(np.stack([a, b], axis=1), strict, indicators, prediction, labels)
+
+
+def products_prediction(wh: Warehouse, product_names: List[str], only_quantities: bool, monthly: bool,
+                        additive: bool) -> MatrixForecast:
+    """ Funkcja obliczajaca prognoze na nastepne 12 miesiecy / 4 kwartaly dla wielu produktow naraz """
+    sales, starts, last_period = sales_matrix(wh, product_names, only_quantities, monthly)
+    return matrix_prediction(sales, starts, monthly, additive, last_period)
+
+
 """ Funkcja dla wykresu prognozy """
 
 
 def prediction_plot(wh: Warehouse, product_name, only_quantities: bool, monthly: bool, additive: bool, only_pred: bool):
     # only_pred: True - wykresy tylko dla prognozy; False - wykresy takze dla wartosci historycznych
-    pred = counting_prediction(wh, product_name, only_quantities, monthly, additive)  # prognoza
-    sales = sales_sum(wh, product_name, only_quantities, monthly)  # dane historyczne
-    parameters = linear_trend_parameters(wh, product_name, only_quantities, monthly)  # parametry funkcji trendu
+    decomposition = _seasonal_decomposition(wh, product_name, only_quantities, monthly, additive)
+    pred = decomposition.prediction  # prognoza
+    sales = decomposition.sales  # dane historyczne
+    parameters = decomposition.trend  # parametry funkcji trendu
     a = parameters[0]
     b = parameters[1]
     sales_names = list(sales)  # nazwy dla poszczegolnych danych historycznych
@@ -1,6 +1,16 @@
+import bisect
 import csv
-from typing import NamedTuple, Optional, Dict, Tuple, Set
+import itertools
+import locale
+import os
+import tempfile
+from collections.abc import Mapping, Sequence, ValuesView, ItemsView
+from decimal import Decimal
+from functools import lru_cache
+from typing import NamedTuple, Optional, Dict, Tuple, Set, List, Callable, Iterable, Iterator, FrozenSet
 from enum import Enum
+
+import numpy as np
 from moneyed import Money, PLN
 from datetime import date
 
@@ -54,31 +64,447 @@ class OperationType(Enum):
     SALE = 2
 
 
-class Operation(NamedTuple):
-    id: int
-    date: date
-    type: OperationType
-    product: Product
-    quantity: int
-    price: Money
+class Operation:
+    """
+    Single operation kept as integers: date as ordinal (day), type as value of OperationType (type_code)
+    and unit price in grosze. Money objects are created only when accessed, dates are shared between operations.
+    """
+
+    __slots__ = ('id', 'day', 'date', 'type_code', 'product', 'quantity', 'grosze')
+
+    def __init__(self, id: int, date: date, type: OperationType, product: Product, quantity: int, price: Money):
+        self.id = id
+        self.day = date.toordinal()
+        self.date = _date_from_ordinal(self.day)
+        self.type_code = type.value
+        self.product = product
+        self.quantity = quantity
+        self.grosze = to_grosze(price)
+
+    @classmethod
+    def from_columns(cls, id: int, day: int, type_code: int, product: Product, quantity: int,
+                     grosze: int) -> 'Operation':
+        """ Creates operation from values stored in columns (see OperationColumns) """
+        operation = cls.__new__(cls)
+        operation.id = id
+        operation.day = day
+        operation.date = _date_from_ordinal(day)
+        operation.type_code = type_code
+        operation.product = product
+        operation.quantity = quantity
+        operation.grosze = grosze
+        return operation
+
+    @property
+    def type(self) -> OperationType:
+        return _OPERATION_TYPES[self.type_code]
+
+    @property
+    def price(self) -> Money:
+        return from_grosze(self.grosze)
 
     @property
     def total_price(self) -> Money:
-        return self.price * self.quantity
+        return from_grosze(self.grosze * self.quantity)
+
+    def _fields(self) -> tuple:
+        return self.id, self.day, self.type_code, self.product, self.quantity, self.grosze
+
+    def __eq__(self, other):
+        if not isinstance(other, Operation):
+            return NotImplemented
+        return self._fields() == other._fields()
+
+    def __hash__(self):
+        return hash(self._fields())
+
+    def __repr__(self):
+        return f'Operation({self.id}, {self.date}, {self.type.name}, {self.product!r}, {self.quantity}, {self.price})'
+
+
+_OPERATION_TYPES = {t.value: t for t in OperationType}
+
+# operations share few distinct dates, so the objects are reused
+_date_from_ordinal = lru_cache(maxsize=None)(date.fromordinal)
+
+
+def to_grosze(money: Money) -> int:
+    """ Converts money amount to integer number of grosze """
+    return int((money.amount * 100).to_integral_value())
+
+
+@lru_cache(maxsize=65536)
+def from_grosze(grosze: int) -> Money:
+    """ Converts integer number of grosze to money amount """
+    return Money(Decimal(int(grosze)) / 100, PLN)
+
+
+class OperationColumns:
+    """ Operations stored as parallel NumPy arrays (one array per field). """
+
+    FIELDS = (
+        ('ids', np.int64),
+        ('days', np.int32),
+        ('types', np.int8),
+        ('products', np.int32),
+        ('quantities', np.int64),
+        ('prices', np.int64),
+    )
+
+    def __init__(self, capacity: int = 1024):
+        """ Creates empty columns with given initial capacity """
+        self.size = 0
+        self._buffers = {name: np.zeros(capacity, dtype=dtype) for name, dtype in self.FIELDS}
+
+        # ids usually come in increasing order, otherwise lookup by id needs sorting permutation
+        self._ids_increasing = True
+        self._ids_order: Optional[np.ndarray] = None
+
+        # same for dates and lookup of date ranges (permutation and sorted days)
+        self._days_sorted = True
+        self._days_order: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._buffers['ids'][:self.size]
+
+    @property
+    def days(self) -> np.ndarray:
+        """ Dates as proleptic Gregorian ordinals (date.toordinal()) """
+        return self._buffers['days'][:self.size]
+
+    @property
+    def types(self) -> np.ndarray:
+        """ Values of OperationType """
+        return self._buffers['types'][:self.size]
+
+    @property
+    def products(self) -> np.ndarray:
+        """ Indexes in Warehouse.product_list """
+        return self._buffers['products'][:self.size]
+
+    @property
+    def quantities(self) -> np.ndarray:
+        return self._buffers['quantities'][:self.size]
+
+    @property
+    def prices(self) -> np.ndarray:
+        """ Unit prices in grosze """
+        return self._buffers['prices'][:self.size]
+
+    def reserve(self, capacity: int):
+        """ Makes sure that buffers can hold given number of rows """
+        current = len(self._buffers['ids'])
+        if capacity <= current:
+            return
+
+        # grow geometrically so that appending is amortized O(1)
+        capacity = max(capacity, 2 * current)
+        for name, buffer in self._buffers.items():
+            grown = np.zeros(capacity, dtype=buffer.dtype)
+            grown[:self.size] = buffer[:self.size]
+            self._buffers[name] = grown
+
+    def append(self, id: int, day: int, type: int, product: int, quantity: int, price: int):
+        """ Appends single operation """
+        self.reserve(self.size + 1)
+        i = self.size
+        self._buffers['ids'][i] = id
+        self._buffers['days'][i] = day
+        self._buffers['types'][i] = type
+        self._buffers['products'][i] = product
+        self._buffers['quantities'][i] = quantity
+        self._buffers['prices'][i] = price
+        self.size += 1
+        self._added(i)
+
+    def extend(self, ids: np.ndarray, days: np.ndarray, types: np.ndarray, products: np.ndarray,
+               quantities: np.ndarray, prices: np.ndarray):
+        """ Appends many operations given as arrays """
+        n = len(ids)
+        self.reserve(self.size + n)
+        i = self.size
+        self._buffers['ids'][i:i + n] = ids
+        self._buffers['days'][i:i + n] = days
+        self._buffers['types'][i:i + n] = types
+        self._buffers['products'][i:i + n] = products
+        self._buffers['quantities'][i:i + n] = quantities
+        self._buffers['prices'][i:i + n] = prices
+        self.size += n
+        self._added(i)
+
+    def _added(self, start: int):
+        """ Updates id lookup after rows from start were filled """
+        ids = self._buffers['ids'][max(start - 1, 0):self.size]
+        self._ids_increasing = self._ids_increasing and bool(np.all(ids[1:] > ids[:-1]))
+        self._ids_order = None
+
+        days = self._buffers['days'][max(start - 1, 0):self.size]
+        self._days_sorted = self._days_sorted and bool(np.all(days[1:] >= days[:-1]))
+        self._days_order = None
+
+    def signed_quantities(self, rows) -> np.ndarray:
+        """ Returns change of stock made by operations in given rows (resupply adds, sale removes) """
+        types = self.types[rows]
+        signs = (types == OperationType.RESUPPLY.value).astype(np.int64) - (types == OperationType.SALE.value)
+        return signs * self.quantities[rows]
+
+    def rows_between(self, day_from: int, day_to: int) -> np.ndarray:
+        """ Returns rows of operations from half-open range of days, ordered by date """
+        days = self.days
+        if self._days_sorted:
+            order = None
+        else:
+            if self._days_order is None:
+                order = np.argsort(days, kind='stable')
+                self._days_order = (order, days[order])
+            order, days = self._days_order
+
+        start = int(np.searchsorted(days, day_from, side='left'))
+        end = max(start, int(np.searchsorted(days, day_to, side='left')))
+
+        if order is None:
+            return np.arange(start, end)
+        return order[start:end]
+
+    def find(self, id: int) -> Optional[int]:
+        """ Returns row of operation with given id or None if there is no such operation """
+        ids = self.ids
+        if self._ids_increasing:
+            row = int(np.searchsorted(ids, id))
+        else:
+            if self._ids_order is None:
+                self._ids_order = np.argsort(ids, kind='stable')
+            i = int(np.searchsorted(ids, id, sorter=self._ids_order))
+            row = int(self._ids_order[i]) if i < self.size else self.size
+
+        if row < self.size and ids[row] == id:
+            return row
+        return None
+
+    def contains_any(self, ids: np.ndarray) -> bool:
+        """ Checks if any of given ids is already stored """
+        if not self.size or not len(ids):
+            return False
+        if self._ids_increasing and ids.min() > self.ids[-1]:
+            return False
+        return bool(np.isin(ids, self.ids).any())
+
+
+class MonthlyRollup:
+    """
+    Operations summed up per product and month: sold and resupplied quantities, income and costs (in grosze).
+    Months are counted from January 1970 (see month_of()).
+    """
+
+    MEASURES = ('sales', 'resupply', 'income', 'costs')
+
+    def __init__(self):
+        self.first_month = 0
+        self._cube = np.zeros((len(self.MEASURES), 0, 0), dtype=np.int64)
+
+    @staticmethod
+    def month_of(days: np.ndarray) -> np.ndarray:
+        """ Converts day ordinals to months counted from January 1970 """
+        return (np.asarray(days, dtype=np.int64) - _EPOCH_ORDINAL).astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+
+    def add(self, columns: 'OperationColumns', rows: np.ndarray):
+        """ Adds operations from given rows of columns """
+        if not len(rows):
+            return
+
+        months = self.month_of(columns.days[rows])
+        products = columns.products[rows]
+        self._fit(int(products.max()) + 1, int(months.min()), int(months.max()) + 1)
+
+        types = columns.types[rows]
+        quantities = columns.quantities[rows]
+        values = quantities * columns.prices[rows]
+        sale = types == OperationType.SALE.value
+        resupply = types == OperationType.RESUPPLY.value
+
+        months = months - self.first_month
+        for i, (mask, measure) in enumerate(((sale, quantities), (resupply, quantities), (sale, values), (resupply, values))):
+            np.add.at(self._cube[i], (products[mask], months[mask]), measure[mask])
+
+    def _fit(self, products: int, month_from: int, month_to: int):
+        """ Grows cube to hold given number of products and range of months """
+        _, current_products, current_months = self._cube.shape
+        if not current_months:
+            self.first_month = month_from
+        first = min(self.first_month, month_from)
+        last = max(self.first_month + current_months, month_to)
+        products = max(products, current_products)
+
+        if (products, last - first) != (current_products, current_months):
+            cube = np.zeros((len(self.MEASURES), products, last - first), dtype=np.int64)
+            shift = self.first_month - first
+            cube[:, :current_products, shift:shift + current_months] = self._cube
+            self._cube = cube
+            self.first_month = first
+
+    def table(self, measure: str, products: np.ndarray, month_from: int, month_to: int) -> np.ndarray:
+        """ Returns monthly values of measure for each of given products (indexes) for half-open range of months """
+        products = np.asarray(products, dtype=np.intp)
+        result = np.zeros((len(products), max(month_to - month_from, 0)), dtype=np.int64)
+        cube = self._cube[self.MEASURES.index(measure)]
+        stored = products < cube.shape[0]
+
+        # part of range which is stored in cube
+        start = max(month_from, self.first_month)
+        end = min(month_to, self.first_month + cube.shape[1])
+        if start < end:
+            result[stored, start - month_from:end - month_from] = \
+                cube[products[stored], start - self.first_month:end - self.first_month]
+        return result
+
+    def series(self, measure: str, products: np.ndarray, month_from: int, month_to: int) -> np.ndarray:
+        """ Returns monthly sums of measure over given products (indexes) for half-open range of months """
+        return self.table(measure, products, month_from, month_to).sum(axis=0)
+
+
+class Operations(Mapping):
+    """ Read-only mapping of operation id to Operation backed by warehouse columns. """
+
+    def __init__(self, wh: 'Warehouse'):
+        self._wh = wh
+
+    def __len__(self):
+        return len(self._wh.columns)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._wh.columns.ids.tolist())
+
+    def __contains__(self, id) -> bool:
+        return self._wh.columns.find(id) is not None
+
+    def __getitem__(self, id: int) -> Operation:
+        row = self._wh.columns.find(id)
+        if row is None:
+            raise KeyError(id)
+        return self._wh.operation_at(row)
+
+    def values(self) -> ValuesView:
+        return _OperationsValues(self)
+
+    def items(self) -> ItemsView:
+        return _OperationsItems(self)
+
+    def _iter_rows(self) -> Iterator[Operation]:
+        """ Yields operations in loading order """
+        for start in range(0, len(self), 4096):
+            yield from self._wh.operations_at(range(start, min(start + 4096, len(self))))
+
+
+class _OperationsValues(ValuesView):
+    def __iter__(self):
+        return self._mapping._iter_rows()
+
+
+class _OperationsItems(ItemsView):
+    def __iter__(self):
+        return ((op.id, op) for op in self._mapping._iter_rows())
+
+
+class OperationsView(Sequence):
+    """ Read-only sequence of operations stored in given rows of warehouse columns, created on access. """
+
+    def __init__(self, wh: 'Warehouse', rows: np.ndarray):
+        self._wh = wh
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return OperationsView(self._wh, self.rows[i])
+        return self._wh.operation_at(self.rows[i])
+
+    def __iter__(self) -> Iterator[Operation]:
+        for start in range(0, len(self.rows), 4096):
+            yield from self._wh.operations_at(self.rows[start:start + 4096])
 
 
 class Warehouse:
     """ Class that stores and manages available data. """
+
+    # version of snapshot file format, snapshots in other versions are ignored
+    SNAPSHOT_VERSION = 2
+
+    # number of operations parsed at once by load_operations
+    CHUNK_SIZE = 65536
+
+    # encoding of all CSV files, None - encoding of locale (as in open())
+    ENCODING = None
     
     def __init__(self):
         """ Creates empty warehouse """
         self.categories: Dict[int, Category] = {}
         self.products: Dict[str, Product] = {}
-        self.operations: Dict[int, Operation] = {}
+
+        # changed on every modification of warehouse, identifies its data (e.g. for caches)
+        self.version = next(_versions)
+
+        # each category with its parents and bit of each category in category bitmasks
+        self.category_ancestors: Dict[int, FrozenSet[Category]] = {}
+        self.category_bits: Dict[int, int] = {}
+
+        # products numbered in loading order (used by columns)
+        self.product_list: List[Product] = []
+        self.product_index: Dict[str, int] = {}
+
+        # product ids in alphabetical order with their indexes in product_list (for prefix search)
+        self._sorted_product_ids: List[str] = []
+        self._sorted_product_indexes: List[int] = []
+
+        # inverted indexes: attribute -> value -> sorted indexes in product_list
+        # (category index contains products of subcategories as well)
+        self.attribute_index: Dict[str, Dict[object, List[int]]] = {
+            'name': {}, 'color': {}, 'size': {}, 'sex': {}, 'category': {}
+        }
+
+        # attribute -> (values, value codes, product indexes) built from attribute_index on demand
+        self._attribute_codes: Dict[str, Tuple[List[object], np.ndarray, np.ndarray]] = {}
+
+        # bitmask of all categories (with parents) of each product (see product_category_masks()), built on demand
+        self._category_masks: Optional[np.ndarray] = None
+
+        # operations are stored as NumPy arrays, operations is only a view on them
+        self.columns = OperationColumns()
+        self.operations: Mapping[int, Operation] = Operations(self)
+
+        # operations summed up per product and month
+        self.monthly = MonthlyRollup()
+
+        # stock of product after each of its operations (see stock_timeline()), built on demand
+        self._stock_timelines: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+        # rows of all operations grouped by product and sorted by date and id, with start of each product
+        # (see product_rows()), built on demand and updated when operations are added
+        self._history_index: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+        # rows of all sales and of sales grouped by product (with start of each product), both sorted
+        # by date and id (see sale_rows()), built on demand and updated when operations are added
+        self._sale_index: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+
+        # paths of loaded CSV files: categories, products, operations
+        self.sources: Optional[Tuple[str, str, str]] = None
+        # modification times and sizes of the files taken before they were parsed (see save_snapshot())
+        self._sources_stats: List[Tuple[int, int]] = []
+
+        # position in operations file after last read row and the row itself (see refresh())
+        self._operations_path: Optional[str] = None
+        self._operations_offset = 0
+        self._operations_tail = b''
+        self.last_operation_id: Optional[int] = None
         
     def load_categories(self, path: str):
         """ Loads catories from given CSV file """
-        with open(path, 'r') as f:
+        with open(path, 'r', encoding=self.ENCODING) as f:
             csv_reader = csv.reader(f, delimiter=';')
             # skip header 
             next(csv_reader)
@@ -89,11 +515,11 @@ class Warehouse:
                 else:
                     p = self.categories[int(row[2])]
                 
-                self.categories[int(row[0])] = Category(int(row[0]), row[1], p)
+                self.add_category(Category(int(row[0]), row[1], p))
                                        
     def load_products(self, path: str):
         """ Loads products from given CSV file """
-        with open(path, 'r') as f:
+        with open(path, 'r', encoding=self.ENCODING) as f:
             csv_reader = csv.reader(f, delimiter=';')
             # skip header 
             next(csv_reader)
@@ -106,31 +532,535 @@ class Warehouse:
                     for c in row[5].split(';')
                 )
                 
-                self.products[row[0]] = Product(row[0], row[1], size, sex, row[4].lower(), categories, float(row[6]))
-                
-    def load_operations(self, path: str):
-        """ Loads operations from given CSV file """
-        with open(path, 'r') as f:
-            csv_reader = csv.reader(f, delimiter=';')
-            # skip header 
-            next(csv_reader)
-            
-            for row in csv_reader:
-                operation_type = OperationType[row[2].upper()]
-                operation_date = date.fromisoformat(row[1])
-                product = self.products[row[3]]
-                price = Money(row[5], PLN)
-                
-                self.operations[int(row[0])] = Operation(int(row[0]), operation_date, operation_type, product, int(row[4]), price)
+                self.add_product(Product(row[0], row[1], size, sex, row[4].lower(), categories, float(row[6])))
                 
-    def load(self, path_categories: str, path_products: str, path_operations: str):
-        """ Loads warehouse data from given files """
+    def load_operations(self, path: str, chunk_size: int = None, progress: Callable[[int, int], None] = None):
+        """
+        Loads operations from given CSV file.
+        File is parsed in chunks of chunk_size rows straight into columns, after each chunk
+        progress is called with number of bytes read and size of the file.
+        """
+        chunk_size = chunk_size or self.CHUNK_SIZE
+        total = os.path.getsize(path)
+
+        with open(path, 'rb') as f:
+            # skip header
+            f.readline()
+
+            while True:
+                lines = _read_lines(f, chunk_size)
+                if not lines:
+                    break
+
+                self.add_operations(*self._parse_operations(lines))
+
+                if progress is not None:
+                    progress(f.tell(), total)
+
+            self._remember_operations_file(f, path)
+
+    def refresh(self) -> int:
+        """
+        Loads operations appended to operations file since it was loaded, returns number of new operations.
+        Only complete rows are read, file which was rewritten instead of appended is loaded again from scratch
+        (then operations with ids which weren't loaded before are counted as new).
+        """
+        path = self._operations_path
+        if path is None:
+            raise ValueError('Operations were not loaded from file')
+
+        size = os.path.getsize(path)
+        if size == self._operations_offset:
+            return 0
+
+        with open(path, 'rb') as f:
+            # check that already read part of file is unchanged
+            if size < self._operations_offset or _read_tail(f, self._operations_offset) != self._operations_tail:
+                return self._reload()
+
+            f.seek(self._operations_offset)
+            data = f.read()
+
+            # leave incomplete last row for later
+            end = data.rfind(b'\n') + 1
+            lines = [line for line in data[:end].splitlines(keepends=True) if line.strip()]
+            if not lines:
+                return 0
+
+            columns = self._parse_operations(lines)
+            if columns[0].min() <= self.last_operation_id:
+                return self._reload()
+
+            self.add_operations(*columns)
+            self._operations_offset += end
+            self._operations_tail = _read_tail(f, self._operations_offset)
+            self.last_operation_id = int(columns[0].max())
+
+        return len(lines)
+
+    def _reload(self) -> int:
+        """ Loads warehouse again from its sources, returns number of operations with ids which weren't loaded before """
+        sources = self.sources
+        if sources is None:
+            raise ValueError('Warehouse was not loaded from files')
+        old_ids = self.columns.ids.copy()
+        self.__init__()
+        self.load(*sources)
+        return int(np.count_nonzero(~np.isin(self.columns.ids, old_ids)))
+
+    def _remember_operations_file(self, f, path: str):
+        """ Saves current position in operations file for refresh() """
+        self._operations_path = path
+        self._operations_offset = f.tell()
+        self._operations_tail = _read_tail(f, self._operations_offset)
+        self.last_operation_id = int(self.columns.ids.max()) if len(self.columns) else 0
+
+    def _parse_operations(self, lines: List[bytes]) -> Tuple[np.ndarray, ...]:
+        """ Parses CSV lines of operations into columns (see OperationColumns) """
+        encoding = self.ENCODING or locale.getpreferredencoding(False)
+        rows = [row for row in csv.reader((line.decode(encoding) for line in lines), delimiter=';') if row]
+        operation_types = {t.name: t.value for t in OperationType}
+
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        days = np.array([row[1] for row in rows], dtype='datetime64[D]').astype(np.int64) + _EPOCH_ORDINAL
+        types = np.array([operation_types[row[2].upper()] for row in rows], dtype=np.int8)
+        products = np.array([self.product_index[row[3]] for row in rows], dtype=np.int32)
+        quantities = np.array([row[4] for row in rows], dtype=np.int64)
+        prices = np.rint(np.array([row[5] for row in rows], dtype=np.float64) * 100).astype(np.int64)
+
+        return ids, days, types, products, quantities, prices
+
+    def add_category(self, category: Category):
+        """ Adds category to warehouse, its parent has to be added before """
+        ancestors = {category}
+        if category.parent is not None:
+            ancestors.update(self.category_ancestors[category.parent.id])
+
+        if category.id not in self.category_bits:
+            self.category_bits[category.id] = len(self.category_bits)
+        self.category_ancestors[category.id] = frozenset(ancestors)
+        self.categories[category.id] = category
+        self._category_masks = None
+        self.version = next(_versions)
+
+    def categories_mask(self, categories: Iterable[Category]) -> np.ndarray:
+        """ Returns bitmask (array of 64-bit words) of given categories and all their parents """
+        mask = np.zeros((len(self.category_bits) + 63) // 64, dtype=np.uint64)
+        for cat in categories:
+            for ancestor in self.category_ancestors[cat.id]:
+                bit = self.category_bits[ancestor.id]
+                mask[bit // 64] |= np.uint64(1 << (bit % 64))
+        return mask
+
+    def product_category_masks(self) -> np.ndarray:
+        """ Returns bitmasks of categories (see categories_mask()) of products in product_list, one row per product """
+        if self._category_masks is None:
+            masks = np.zeros((len(self.product_list), (len(self.category_bits) + 63) // 64), dtype=np.uint64)
+            # category index already contains parents of categories of products
+            values, codes, products = self.attribute_codes('category')
+            bits = np.array([self.category_bits[cat_id] for cat_id in values], dtype=np.uint64)[codes]
+            np.bitwise_or.at(masks, (products, (bits // 64).astype(np.intp)), np.left_shift(np.uint64(1), bits % 64))
+            masks.flags.writeable = False
+            self._category_masks = masks
+        return self._category_masks
+
+    def add_product(self, product: Product):
+        """ Adds product to warehouse """
+        if product.id not in self.product_index:
+            self.product_index[product.id] = len(self.product_list)
+            self.product_list.append(product)
+
+            i = bisect.bisect_left(self._sorted_product_ids, product.id)
+            self._sorted_product_ids.insert(i, product.id)
+            self._sorted_product_indexes.insert(i, self.product_index[product.id])
+        else:
+            self._index_product(self.product_list[self.product_index[product.id]], remove=True)
+            self.product_list[self.product_index[product.id]] = product
+        self.products[product.id] = product
+        self._index_product(product)
+        self._history_index = None
+        self._sale_index = None
+        self.version = next(_versions)
+
+    def products_with_prefixes(self, prefixes: Iterable[str]) -> np.ndarray:
+        """ Returns sorted indexes (in product_list) of products which id starts with any of given prefixes """
+        ids = self._sorted_product_ids
+        found = []
+        covered = None
+        for prefix in sorted(set(prefixes)):
+            # prefixes are sorted, so prefix extending previous one is right after it
+            if covered is not None and prefix.startswith(covered):
+                continue
+            covered = prefix
+
+            # ids with given prefix form contiguous range of sorted ids
+            start = bisect.bisect_left(ids, prefix)
+            end = bisect.bisect_left(ids, prefix + '\U0010ffff', start)
+            found.extend(self._sorted_product_indexes[start:end])
+
+        return np.array(sorted(found), dtype=np.intp)
+
+    def _index_product(self, product: Product, remove: bool = False):
+        """ Adds product to (or removes it from) attribute indexes """
+        i = self.product_index[product.id]
+        categories = {cat.id for cat in product.categories for cat in self.category_ancestors[cat.id]}
+        keys = [('name', product.name), ('color', product.color), ('size', product.size), ('sex', product.sex)]
+        keys += [('category', cat) for cat in categories]
+        self._attribute_codes.clear()
+        self._category_masks = None
+
+        for attribute, value in keys:
+            indexes = self.attribute_index[attribute].setdefault(value, [])
+            if remove:
+                indexes.remove(i)
+            elif not indexes or indexes[-1] < i:
+                indexes.append(i)
+            else:
+                bisect.insort(indexes, i)
+
+    def attribute_codes(self, attribute: str) -> Tuple[List[object], np.ndarray, np.ndarray]:
+        """
+        Returns values of attribute and pairs (value code, product index) of attribute index.
+        Code is position of value in returned list, product has one pair for each of its values.
+        """
+        if attribute not in self._attribute_codes:
+            index = self.attribute_index[attribute]
+            values = list(index)
+            sizes = np.fromiter((len(index[value]) for value in values), dtype=np.intp, count=len(values))
+            codes = np.repeat(np.arange(len(values)), sizes)
+            products = np.fromiter((i for value in values for i in index[value]), dtype=np.intp, count=len(codes))
+            self._attribute_codes[attribute] = (values, codes, products)
+        return self._attribute_codes[attribute]
+
+    def add_operation(self, operation: Operation):
+        """ Adds operation to warehouse """
+        if operation.id in self.operations:
+            raise ValueError(f'Operation {operation.id} already exists')
+
+        self.columns.append(
+            operation.id,
+            operation.day,
+            operation.type_code,
+            self.product_index[operation.product.id],
+            operation.quantity,
+            operation.grosze
+        )
+        self._added(range(len(self.columns) - 1, len(self.columns)))
+
+    def add_operations(self, ids: np.ndarray, days: np.ndarray, types: np.ndarray, products: np.ndarray,
+                       quantities: np.ndarray, prices: np.ndarray):
+        """ Adds many operations given as columns (see OperationColumns) """
+        if len(np.unique(ids)) != len(ids) or self.columns.contains_any(ids):
+            raise ValueError('Operations already exist')
+
+        start = len(self.columns)
+        self.columns.extend(ids, days, types, products, quantities, prices)
+        self._added(range(start, len(self.columns)))
+
+    def _added(self, rows: range):
+        """ Updates indexes and aggregates after operations were added to given rows of columns """
+        new_rows = np.arange(rows.start, rows.stop)
+        self.monthly.add(self.columns, new_rows)
+        self._index_rows(new_rows)
+        self.version = next(_versions)
+
+    def _index_rows(self, new_rows: np.ndarray):
+        """ Inserts new rows into already built row indexes, drops stock timelines of their products """
+        columns = self.columns
+        keys = (columns.days, columns.ids)
+
+        if self._history_index is not None:
+            rows, starts = _insert_grouped(*self._history_index, new_rows, columns.products, keys)
+            rows.flags.writeable = False
+            self._history_index = (rows, starts)
+
+        sales = new_rows[columns.types[new_rows] == OperationType.SALE.value]
+        if self._sale_index is not None and len(sales):
+            all_sales, by_product, starts = self._sale_index
+            sales = sales[np.lexsort((columns.ids[sales], columns.days[sales]))]
+            all_sales = np.insert(all_sales, _search_rows(all_sales, sales, keys), sales)
+            by_product, starts = _insert_grouped(by_product, starts, sales, columns.products, keys)
+            all_sales.flags.writeable = by_product.flags.writeable = False
+            self._sale_index = (all_sales, by_product, starts)
+
+        for product in np.unique(columns.products[new_rows]).tolist():
+            self._stock_timelines.pop(self.product_list[product].id, None)
+
+    def product_rows(self, product_id: str) -> np.ndarray:
+        """ Returns rows of operations of given product sorted by date and id, as read-only view """
+        if self._history_index is None:
+            columns = self.columns
+            rows = np.lexsort((columns.ids, columns.days, columns.products))
+            starts = np.searchsorted(columns.products[rows], np.arange(len(self.product_list) + 1))
+            rows.flags.writeable = False
+            self._history_index = (rows, starts)
+
+        rows, starts = self._history_index
+        i = self.product_index.get(product_id)
+        if i is None:
+            return rows[:0]
+        return rows[starts[i]:starts[i + 1]]
+
+    def stock_timeline(self, product_id: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns days of operations of given product (sorted) and stock of the product after each of them.
+        Stock at any day is the last value for days not after it.
+        """
+        if product_id not in self._stock_timelines:
+            rows = self.product_rows(product_id)
+            days = self.columns.days[rows]
+            stock = np.cumsum(self.columns.signed_quantities(rows))
+            self._stock_timelines[product_id] = (days, stock)
+        return self._stock_timelines[product_id]
+
+    def sale_rows(self, product_id: str = None) -> np.ndarray:
+        """ Returns rows of sales of given product (or of all products) sorted by date and id, as read-only view """
+        if self._sale_index is None:
+            columns = self.columns
+            rows = np.flatnonzero(columns.types == OperationType.SALE.value)
+            all_sales = rows[np.lexsort((columns.ids[rows], columns.days[rows]))]
+            by_product = all_sales[np.argsort(columns.products[all_sales], kind='stable')]
+            starts = np.searchsorted(columns.products[by_product], np.arange(len(self.product_list) + 1))
+            all_sales.flags.writeable = by_product.flags.writeable = False
+            self._sale_index = (all_sales, by_product, starts)
+
+        all_sales, by_product, starts = self._sale_index
+        if product_id is None:
+            return all_sales
+        i = self.product_index.get(product_id)
+        if i is None:
+            return by_product[:0]
+        return by_product[starts[i]:starts[i + 1]]
+
+    def operations_view(self, rows: np.ndarray) -> Sequence:
+        """ Returns sequence of operations stored in given rows of columns, operations are created on access """
+        return OperationsView(self, rows)
+
+    def operation_at(self, row: int) -> Operation:
+        """ Returns operation stored in given row of columns """
+        return self.operations_at([row])[0]
+
+    def operations_at(self, rows: Iterable[int]) -> List[Operation]:
+        """ Returns operations stored in given rows of columns """
+        rows = np.fromiter(rows, dtype=np.intp) if not isinstance(rows, np.ndarray) else rows
+        columns = self.columns
+        return [
+            Operation.from_columns(id, day, type_code, self.product_list[product], quantity, grosze)
+            for id, day, type_code, product, quantity, grosze in zip(
+                columns.ids[rows].tolist(), columns.days[rows].tolist(), columns.types[rows].tolist(),
+                columns.products[rows].tolist(), columns.quantities[rows].tolist(), columns.prices[rows].tolist()
+            )
+        ]
+
+    def load(self, path_categories: str, path_products: str, path_operations: str, snapshot: str = None,
+             progress: Callable[[int, int], None] = None):
+        """
+        Loads warehouse data from given files.
+        If snapshot path is given, data is loaded from it when it is up to date with the files,
+        otherwise the files are parsed and snapshot is saved for the next time
+        (if it can't be saved, loaded data is kept and only the next load is slower).
+        Progress of loading operations is reported to progress (see load_operations()).
+        """
+        sources = (path_categories, path_products, path_operations)
+        if snapshot is not None and self.load_snapshot(snapshot, sources):
+            return
+
+        # files are checked before parsing, so snapshot of files modified while loading is never up to date
+        stats = [_file_stat(s) for s in sources]
         self.load_categories(path_categories)
         self.load_products(path_products)
-        self.load_operations(path_operations)
+        self.load_operations(path_operations, progress=progress)
+        self.sources = sources
+        self._sources_stats = stats
+
+        if snapshot is not None:
+            try:
+                self.save_snapshot(snapshot)
+            except OSError:
+                pass
+
+    def save_snapshot(self, path: str):
+        """ Saves warehouse data to binary snapshot file (NumPy npz), creating its directory if needed """
+        categories = list(self.categories.values())
+        sources = self.sources or ()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # snapshot is written to temporary file first, so partially written one is never loaded;
+        # np.savez appends extension to paths without it, write through file object instead
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(
+                    f,
+                    version=self.SNAPSHOT_VERSION,
+                    sources=np.array([os.path.abspath(s) for s in sources], dtype=str),
+                    sources_stats=np.array(self._sources_stats, dtype=np.int64).reshape(-1, 2),
+                    operations_state=np.array([self._operations_offset, self.last_operation_id or 0], dtype=np.int64),
+                    operations_tail=np.frombuffer(self._operations_tail, dtype=np.uint8),
+                    category_ids=np.array([c.id for c in categories], dtype=np.int64),
+                    category_names=np.array([c.name for c in categories], dtype=str),
+                    category_parents=np.array([-1 if c.parent is None else c.parent.id for c in categories], dtype=np.int64),
+                    product_ids=np.array([p.id for p in self.product_list], dtype=str),
+                    product_names=np.array([p.name for p in self.product_list], dtype=str),
+                    product_sizes=np.array([p.size.value for p in self.product_list], dtype=np.int8),
+                    product_sexes=np.array([p.sex.value for p in self.product_list], dtype=np.int8),
+                    product_colors=np.array([p.color for p in self.product_list], dtype=str),
+                    product_categories=np.array([';'.join(str(c.id) for c in p.categories) for p in self.product_list], dtype=str),
+                    product_delivery_times=np.array([p.delivery_time for p in self.product_list], dtype=np.float64),
+                    **{name: getattr(self.columns, name) for name, _ in OperationColumns.FIELDS}
+                )
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def load_snapshot(self, path: str, sources: Tuple[str, str, str] = None) -> bool:
+        """
+        Loads warehouse data from snapshot saved by save_snapshot().
+        Snapshot is rejected (False is returned, warehouse is left unchanged) if it doesn't exist, can't be read,
+        was created from other files than given sources or any of its source files was modified since.
+        """
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                snapshot = self._read_snapshot(data, sources)
+        except Exception:
+            # damaged snapshot (or file which isn't snapshot at all) is only stale cache
+            return False
+        if snapshot is None:
+            return False
+
+        snapshot_sources, stats, categories, products, columns, state, tail = snapshot
+        for category in categories:
+            self.add_category(category)
+        for product in products:
+            self.add_product(product)
+        self.add_operations(*columns)
+
+        self.sources = tuple(snapshot_sources)
+        self._sources_stats = [tuple(stat) for stat in stats]
+        # refresh() continues after rows which were parsed into snapshot
+        self._operations_path = self.sources[2]
+        self._operations_offset, self.last_operation_id = state
+        self._operations_tail = tail
+        return True
+
+    def _read_snapshot(self, data, sources: Optional[Tuple[str, str, str]]) -> Optional[tuple]:
+        """
+        Reads content of snapshot (see load_snapshot()) without modifying warehouse, returns None if it isn't
+        up to date. Snapshot with missing or inconsistent data raises exception.
+        """
+        if int(data['version']) != self.SNAPSHOT_VERSION:
+            return None
+        snapshot_sources = [str(s) for s in data['sources'].tolist()]
+        if sources is not None and snapshot_sources != [os.path.abspath(s) for s in sources]:
+            return None
+        stats = data['sources_stats'].tolist()
+        if len(snapshot_sources) != 3 or stats != [list(_file_stat(s)) for s in snapshot_sources]:
+            return None
+
+        # categories are saved in loading order, so parents come before children
+        categories = {}
+        for cat_id, name, parent in zip(data['category_ids'].tolist(), data['category_names'].tolist(),
+                                        data['category_parents'].tolist()):
+            categories[cat_id] = Category(cat_id, name, None if parent == -1 else categories[parent])
+
+        products = [
+            Product(row[0], row[1], Size(row[2]), Sex(row[3]), row[4],
+                    tuple(categories[int(c)] for c in row[5].split(';')), row[6])
+            for row in zip(data['product_ids'].tolist(), data['product_names'].tolist(),
+                           data['product_sizes'].tolist(), data['product_sexes'].tolist(),
+                           data['product_colors'].tolist(), data['product_categories'].tolist(),
+                           data['product_delivery_times'].tolist())
+        ]
+
+        columns = [data[name] for name, _ in OperationColumns.FIELDS]
+        for column, (name, dtype) in zip(columns, OperationColumns.FIELDS):
+            if column.dtype != dtype or column.shape != columns[0].shape or column.ndim != 1:
+                raise ValueError(f'Invalid column {name} in snapshot')
+        ids, product_indexes = columns[0], columns[3]
+        if len(np.unique(ids)) != len(ids):
+            raise ValueError('Duplicated operations in snapshot')
+        if len(ids) and not 0 <= product_indexes.min() <= product_indexes.max() < len(products):
+            raise ValueError('Invalid products of operations in snapshot')
+
+        offset, last_id = (int(v) for v in data['operations_state'].tolist())
+        tail = data['operations_tail'].astype(np.uint8).tobytes()
+        return snapshot_sources, stats, list(categories.values()), products, columns, (offset, last_id), tail
 
     def get_category_by_name(self, name: str) -> Optional[Category]:
         """ Returns category base on given name """
         for cat in self.categories.values():
             if cat.name.lower() == name.lower():
                 return cat
+
+
+# date.toordinal() of 1970-01-01, start of numpy datetime64
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# versions are unique among all warehouses (see Warehouse.version)
+_versions = itertools.count()
+
+
+def _search_rows(rows: np.ndarray, new_rows: np.ndarray, keys: Tuple[np.ndarray, ...]) -> np.ndarray:
+    """
+    Returns positions at which new rows (sorted) have to be inserted into rows sorted by keys (columns compared
+    in order), as in np.searchsorted().
+    """
+    if not len(rows) or tuple(k[rows[-1]] for k in keys) < tuple(k[new_rows[0]] for k in keys):
+        # rows are usually appended in order, then all of them go to the end
+        return np.full(len(new_rows), len(rows))
+
+    dtype = [(f'k{i}', k.dtype) for i, k in enumerate(keys)]
+    sorted_keys = np.empty(len(rows), dtype=dtype)
+    new_keys = np.empty(len(new_rows), dtype=dtype)
+    for (name, _), k in zip(dtype, keys):
+        sorted_keys[name] = k[rows]
+        new_keys[name] = k[new_rows]
+    return np.searchsorted(sorted_keys, new_keys)
+
+
+def _insert_grouped(rows: np.ndarray, starts: np.ndarray, new_rows: np.ndarray, groups: np.ndarray,
+                    keys: Tuple[np.ndarray, ...]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Inserts new rows into rows grouped by groups (group g is rows[starts[g]:starts[g + 1]]) and sorted by keys
+    within each group, returns new rows and starts. Only groups of new rows are searched.
+    """
+    new_rows = new_rows[np.lexsort(tuple(k[new_rows] for k in reversed(keys)) + (groups[new_rows],))]
+    new_groups = groups[new_rows]
+    # number of new rows before each group
+    shifts = np.searchsorted(new_groups, np.arange(len(starts)))
+
+    positions = np.empty(len(new_rows), dtype=np.intp)
+    for g in np.unique(new_groups).tolist():
+        group_rows = rows[starts[g]:starts[g + 1]]
+        positions[shifts[g]:shifts[g + 1]] = starts[g] + _search_rows(group_rows, new_rows[shifts[g]:shifts[g + 1]], keys)
+    return np.insert(rows, positions, new_rows), starts + shifts
+
+
+def _read_lines(f, count: int) -> List[bytes]:
+    """ Reads up to count non empty lines from binary file """
+    lines = []
+    for line in f:
+        if line.strip():
+            lines.append(line)
+        if len(lines) == count:
+            break
+    return lines
+
+
+def _read_tail(f, offset: int) -> bytes:
+    """ Returns line of binary file which ends at given offset """
+    start = max(0, offset - 4096)
+    f.seek(start)
+    data = f.read(offset - start)
+    return data[data.rstrip(b'\r\n').rfind(b'\n') + 1:]
+
+
+def _file_stat(path: str) -> Tuple[int, int]:
+    """ Returns modification time and size of file, missing file gives (-1, -1) """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return -1, -1
+    return stat.st_mtime_ns, stat.st_size
@@ -1,8 +1,14 @@
 from storage.analysis import *
 from storage.predictions import *
+from storage.analysis import _warm_start_params
+from storage.cache import query_cache, DiskCache, _normalize
+from storage.backtesting import backtest, backtest_series
+from storage.warehouse import OperationColumns
 import unittest
 from unittest.mock import patch
 import os
+import tempfile
+import time
 os.getcwd()
 
 
@@ -10,6 +16,22 @@ wh = Warehouse()
 wh.load('./categories_test.csv','./products_test.csv','./operations_test.csv')
 load_stocktaking('./stocktaking_test.csv')
 
+
+def make_warehouse(operations_from: Warehouse = None, rows=slice(None)) -> Warehouse:
+    """ Returns warehouse with test categories and products and operations copied from given rows of other warehouse """
+    wh2 = Warehouse()
+    wh2.load_categories('./categories_test.csv')
+    wh2.load_products('./products_test.csv')
+    if operations_from is not None:
+        add_operations_from(wh2, operations_from, rows)
+    return wh2
+
+
+def add_operations_from(wh2: Warehouse, source: Warehouse, rows=slice(None)):
+    """ Adds operations from given rows of source warehouse to wh2 """
+    wh2.add_operations(*(getattr(source.columns, name)[rows] for name, _ in OperationColumns.FIELDS))
+
+
 class AnalysisTests(unittest.TestCase):
     def setUp(self):
         self.date_from = date.fromisoformat('2017-01-01')
@@ -24,6 +46,15 @@ class AnalysisTests(unittest.TestCase):
         self.assertListEqual(list(get_statuses(wh, self.date_to).values()),[29, 20, 29, -1])
         self.assertListEqual(list(get_statuses(wh, date.fromisoformat('2011-01-01')).values()), [0,0,0,0])
 
+    def test_get_statuses_at(self):
+        dates = [self.date_to, date.fromisoformat('2011-01-01'), date.fromisoformat('2030-01-01')]
+        products, stock = get_statuses_at(dates, wh)
+        self.assertListEqual(products, list(get_statuses(wh, self.date_to).keys()))
+        self.assertListEqual(stock[:, 0].tolist(), [29, 20, 29, -1])
+        self.assertListEqual(stock[:, 1].tolist(), [0, 0, 0, 0])
+        self.assertListEqual(stock[:, 2].tolist(), [47, 38, 43, -1])
+        self.assertEqual(get_statuses_at(dates, wh, colors=['grey'])[1].tolist(), [[29, 0, 43]])
+
     def test_get_products(self):
         self.assertEqual(len(get_products(wh,['B'],self.name,[wh.categories[4], wh.categories[13]],'white', [Size.XS], [Sex.MAN])), 1)
         self.assertEqual(len(get_products(wh, ['B'], self.name, None, 'white', None, None)), 2)
@@ -56,6 +87,12 @@ class AnalysisTests(unittest.TestCase):
         self.assertEqual(get_products_balance(self.date_from, self.date_to, wh), 1)
         self.assertEqual(get_products_balance(self.date_to, self.date_from, wh), 0)
 
+    def test_get_totals(self):
+        totals = get_totals(self.date_from, self.date_to, wh)
+        self.assertEqual(totals, (Money(4680.00, PLN), Money(2800.00, PLN), 39, 40))
+        self.assertEqual(totals.balance, Money(1880.00, PLN))
+        self.assertEqual(totals.products_balance, 1)
+
     def test_get_best_selling_colors(self):
         self.assertListEqual(get_best_selling_colors(self.date_from, self.date_to,wh), self.list_of_colors)
         self.assertListEqual(get_best_selling_colors(self.date_to, self.date_from, wh), [])
@@ -64,6 +101,49 @@ class AnalysisTests(unittest.TestCase):
         self.assertListEqual(get_best_selling_sizes(self.date_from, self.date_to, wh), self.list_of_sizes)
         self.assertListEqual(get_best_selling_sizes(self.date_to, self.date_from, wh), [])
 
+    def test_group_by_ties(self):
+        wh2 = make_warehouse()
+        # equal sales, but product loaded later is sold first
+        sale = np.full(2, OperationType.SALE.value)
+        wh2.add_operations(np.array([1, 2]), np.full(2, self.date_from.toordinal()), sale, np.array([3, 0]),
+                           np.array([5, 5]), np.array([100, 100]))
+        self.assertListEqual(get_best_selling_sizes(self.date_from, self.date_to, wh2), [(5, Size.S), (5, Size.XL)])
+        self.assertListEqual(get_best_selling_colors(self.date_from, self.date_to, wh2), [(5, 'white'), (5, 'black')])
+        self.assertListEqual(group_by('color', 'quantity', self.date_from, self.date_to, wh2), [(5, 'black'), (5, 'white')])
+
+    def test_group_by(self):
+        self.assertListEqual(group_by('color', 'quantity', self.date_from, self.date_to, wh), self.list_of_colors)
+        margins = group_by('product', 'margin', self.date_from, self.date_to, wh)
+        self.assertEqual(sum((margin for margin, _ in margins), Money(0, PLN)), get_balance(self.date_from, self.date_to, wh))
+        self.assertListEqual(group_by('product', 'margin', self.date_from, self.date_to, wh, top_k=1), margins[:1])
+        incomes = dict((cat.id, income) for income, cat in group_by('category', 'income', self.date_from, self.date_to, wh))
+        self.assertEqual(incomes[4], get_income(self.date_from, self.date_to, wh, categories=[wh.categories[4]]))
+        self.assertListEqual(group_by('sex', 'cost', self.date_to, self.date_from, wh), [])
+
+    def test_exact_money(self):
+        wh2 = make_warehouse()
+        sale = np.full(2, OperationType.SALE.value)
+        wh2.add_operations(np.array([1, 2]), np.full(2, self.date_from.toordinal()), sale, np.zeros(2, dtype=int),
+                           np.array([2 ** 30, 1]), np.array([2 ** 24 + 1, 1]))
+        expected = from_grosze(2 ** 54 + 2 ** 30 + 1)
+        self.assertEqual(get_income(self.date_from, self.date_to, wh2), expected)
+        self.assertListEqual(group_by('color', 'income', self.date_from, self.date_to, wh2), [(expected, 'white')])
+
+    def test_query_cache(self):
+        hits = query_cache.info().hits
+        statuses = get_statuses(wh, self.date_to, colors=['white', 'grey'])
+        statuses.clear()
+        statuses = get_statuses(wh, self.date_to, colors=['grey', 'white'])
+        self.assertEqual(query_cache.info().hits, hits + 1)
+        self.assertEqual(statuses, {prod: count for prod, count in get_statuses(wh, self.date_to).items() if prod.color != 'black'})
+        self.assertNotEqual(_normalize(Category(1, '2', None)), _normalize(Category(2, '1', None)))
+        self.assertEqual(_normalize(()), ())
+
+        wh2 = make_warehouse()
+        self.assertEqual(get_sales(self.date_from, self.date_to, wh2), 0)
+        add_operations_from(wh2, wh)
+        self.assertEqual(get_sales(self.date_from, self.date_to, wh2), get_sales(self.date_from, self.date_to, wh))
+
     def test_compare_with_stocktaking(self):
         self.assertListEqual(list(compare_with_stocktaking(self.inv,wh).values()),[0,-2,3,2])
 
@@ -95,6 +175,329 @@ class AnalysisTests(unittest.TestCase):
         with patch('storage.analysis.forecast_values', return_value=None) as mock:
             assert get_months_for_supplies("BHaP01MWhi", 10, wh) == 'brak danych'
 
+    def test_get_months_for_supplies_many(self):
+        with patch('storage.analysis.forecast_values', return_value=[4.,4.,4.,4.,4.,4.]) as mock:
+            self.assertListEqual(get_months_for_supplies_many(["BHaP01MWhi", "BHaP05"], [4, 200], wh, workers=1), [1, '>6'])
+            self.assertListEqual(mock.call_args_list[0][0][0], get_monthly_sales(36, wh, id_prefixes=["BHaP01MWhi"]))
+            self.assertListEqual(mock.call_args_list[1][0][0], get_monthly_sales(36, wh, id_prefixes=["BHaP05"]))
+        with patch('storage.analysis.forecast_values', side_effect=FitTimeout):
+            self.assertListEqual(get_months_for_supplies_many(["BHaP01MWhi"], [4], wh, workers=1), ['przekroczono czas'])
+
+        # stuck task is killed after all rounds of tasks
+        start = time.time()
+        self.assertListEqual(map_in_processes(time.sleep, [(0,), (30,)], workers=2, timeout=0.5, timed_out='stuck'), [None, 'stuck'])
+        self.assertLess(time.time() - start, 10)
+
+
+    def test_forecast_cache(self):
+        data = [float(10 + i % 12 + (i % 5 == 0)) for i in range(37)]
+        with tempfile.TemporaryDirectory() as tmp, patch('storage.analysis.forecast_cache', DiskCache(tmp)):
+            forecast = forecast_values(data[:36], 6, 12)
+            self.assertEqual(len(forecast), 6)
+            with patch('statsmodels.tsa.statespace.sarimax.SARIMAX', side_effect=AssertionError):
+                self.assertListEqual(forecast_values(data[:36], 6, 12), forecast)
+
+            order, seasonal_order = (2, 1, 1), (1, 0, 0, 12)
+            params = _warm_start_params(data[:37], order, seasonal_order)
+            self.assertIsNotNone(params)
+            self.assertListEqual(_warm_start_params(data[1:37], order, seasonal_order), params)
+            self.assertIsNone(_warm_start_params(data[2:37], order, seasonal_order))
+
+            with self.assertRaises(FitTimeout):
+                forecast_values(data[1:], 6, 12, time_limit=0)
+
+            files = sorted(os.listdir(tmp))
+            self.assertEqual(len(forecast_values(data[1:], 6, 12, use_cache=False)), 6)
+            self.assertListEqual(sorted(os.listdir(tmp)), files)
+
+    def test_disk_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = DiskCache(tmp, maxsize=3)
+            cache.put(('a', 1), [1.5, 2.0])
+            self.assertListEqual(cache.get(('a', 1)), [1.5, 2.0])
+            self.assertIsNone(DiskCache(tmp, version=2).get(('a', 1)))
+
+            # files not saved by cache are ignored
+            with open(cache._file(('b', 1)), 'w') as f:
+                f.write('[1, 2]')
+            self.assertIsNone(cache.get(('b', 1)))
+            self.assertIsNone(DiskCache(tmp, max_age=-1).get(('a', 1)))
+
+            cache.clear()
+            for i in range(5):
+                cache.put(('c', i), i)
+                os.utime(cache._file(('c', i)), (time.time() - 10 + i,) * 2)
+            cache.prune()
+            self.assertListEqual([cache.get(('c', i)) for i in range(5)], [None, None, 2, 3, 4])
+            cache.clear()
+            self.assertListEqual(os.listdir(tmp), [])
+
+
+class WarehouseTests(unittest.TestCase):
+    def test_columns(self):
+        self.assertEqual(len(wh.columns), len(wh.operations))
+        op = wh.operations[4]
+        self.assertEqual(wh.columns.days[3], op.date.toordinal())
+        self.assertEqual(wh.columns.types[3], OperationType.SALE.value)
+        self.assertEqual(wh.product_list[wh.columns.products[3]], op.product)
+        self.assertEqual(wh.columns.quantities[3], 2)
+        self.assertEqual(wh.columns.prices[3], 11000)
+
+    def test_get_product_operations(self):
+        operations = get_product_operations(wh.products['BHaP05MGry'], wh)
+        self.assertEqual(len(operations), sum(op.product.id == 'BHaP05MGry' for op in wh.operations.values()))
+        self.assertListEqual(operations, sorted(operations, key=lambda op: (op.date, op.id)))
+
+    def test_category_index(self):
+        for cat in wh.categories.values():
+            products = [i for i, prod in enumerate(wh.product_list) if cat in prod.all_categories]
+            self.assertListEqual(wh.attribute_index['category'].get(cat.id, []), products)
+
+    def test_product_category_masks(self):
+        masks = wh.product_category_masks()
+        for i, prod in enumerate(wh.product_list):
+            self.assertListEqual(masks[i].tolist(), wh.categories_mask(prod.categories).tolist())
+            bits = {wh.category_bits[cat.id] for cat in prod.all_categories}
+            self.assertEqual(sum(1 << bit for bit in bits), sum(int(word) << (64 * j) for j, word in enumerate(masks[i])))
+
+    def test_products_with_prefixes(self):
+        ids = lambda prefixes: [wh.product_list[i].id for i in wh.products_with_prefixes(prefixes)]
+        self.assertListEqual(ids(['BHaP05']), ['BHaP05MWhi', 'BHaP05MGry'])
+        self.assertListEqual(ids(['BHaP05', 'BHaP', 'BI']), ['BHaP05MWhi', 'BHaP01MWhi', 'BHaP05MGry', 'BIrM02MBla'])
+        self.assertListEqual(ids(['BHaP01MWhi', 'X']), ['BHaP01MWhi'])
+        self.assertListEqual(ids([]), [])
+
+    def test_rows_between(self):
+        days = wh.columns.days
+        rows = wh.columns.rows_between(date(2015, 1, 1).toordinal(), date(2016, 1, 1).toordinal())
+        self.assertEqual(len(rows), ((days >= date(2015, 1, 1).toordinal()) & (days < date(2016, 1, 1).toordinal())).sum())
+
+        # operations in reversed order
+        wh2 = make_warehouse(wh, slice(None, None, -1))
+        self.assertEqual(get_totals(date(2015, 1, 1), date(2016, 1, 1), wh2), get_totals(date(2015, 1, 1), date(2016, 1, 1), wh))
+        self.assertEqual(get_sales(date(2015, 3, 1), date(2015, 4, 1), wh2), get_sales(date(2015, 3, 1), date(2015, 4, 1), wh))
+        for prod in wh.product_list:
+            self.assertListEqual(get_product_operations(prod, wh2), get_product_operations(prod, wh))
+            self.assertEqual(stock_status_for_product(prod, wh2), stock_status_for_product(prod, wh))
+
+        # indexes are updated after appending
+        stock = stock_status_for_product(wh.products['BHaP01MWhi'], wh2)
+        wh2.add_operation(Operation(9999, date(2011, 1, 1), OperationType.RESUPPLY, wh.products['BHaP01MWhi'], 5, Money(10, PLN)))
+        self.assertEqual(get_product_operations(wh.products['BHaP01MWhi'], wh2)[0].id, 9999)
+        self.assertEqual(stock_status_for_product(wh.products['BHaP01MWhi'], wh2), stock + 5)
+        wh2.sale_rows()
+        wh2.add_operation(Operation(9998, date(2015, 3, 1), OperationType.SALE, wh.products['BHaP05MGry'], 1, Money(10, PLN)))
+        rebuilt = make_warehouse(wh2)
+        for prod in wh.product_list:
+            self.assertListEqual(wh2.product_rows(prod.id).tolist(), rebuilt.product_rows(prod.id).tolist())
+            self.assertListEqual(wh2.sale_rows(prod.id).tolist(), rebuilt.sale_rows(prod.id).tolist())
+        self.assertListEqual(wh2.sale_rows().tolist(), rebuilt.sale_rows().tolist())
+
+    def test_monthly(self):
+        month = MonthlyRollup.month_of(np.array([date(2015, 3, 1).toordinal()]))[0]
+        products = np.arange(len(wh.product_list))
+        self.assertEqual(wh.monthly.series('sales', products, month, month + 1)[0], get_sales(date(2015, 3, 1), date(2015, 4, 1), wh))
+        self.assertEqual(from_grosze(int(wh.monthly.series('income', products, month, month + 12).sum())), get_income(date(2015, 3, 1), date(2016, 3, 1), wh))
+        self.assertListEqual(wh.monthly.series('sales', products, 0, 3).tolist(), [0, 0, 0])
+
+    def test_sale_rows(self):
+        rows = wh.sale_rows('BHaP05MGry')
+        operations = [op for op in wh.operations.values() if op.product.id == 'BHaP05MGry' and op.type == OperationType.SALE]
+        self.assertListEqual(list(wh.operations_view(rows)), sorted(operations, key=lambda op: (op.date, op.id)))
+        self.assertIs(wh.sale_rows(), wh.sale_rows())
+        self.assertEqual(len(wh.sale_rows()), sum(len(wh.sale_rows(prod.id)) for prod in wh.product_list))
+        self.assertEqual(len(only_sales_for_product(wh, None)[:10]), 10)
+        self.assertListEqual(list(only_sales_for_product(wh, 'NOPE')), [])
+
+    def test_encoding(self):
+        name = '\u017b\u00f3\u0142w'
+        with tempfile.TemporaryDirectory() as tmp, patch.object(Warehouse, 'ENCODING', 'cp1250'):
+            paths = [os.path.join(tmp, file_name) for file_name in ('products.csv', 'operations.csv')]
+            with open('./products_test.csv', 'rb') as src, open(paths[0], 'wb') as dst:
+                dst.write(src.read() + '{0};{0};M;Man;Green;"4";60\n'.format(name).encode('cp1250'))
+            with open(paths[1], 'wb') as f:
+                f.write('Id;Date;Type;Product;Quantity;Price\n1;2020-01-01;SALE;{};2;10\n'.format(name).encode('cp1250'))
+
+            wh2 = Warehouse()
+            wh2.load('./categories_test.csv', *paths)
+            self.assertEqual(wh2.operations[1].product, wh2.products[name])
+
+    def test_snapshot(self):
+        sources = ('./categories_test.csv', './products_test.csv', './operations_test.csv')
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'warehouse.npz')
+            self.assertFalse(Warehouse().load_snapshot(path, sources))
+
+            wh.save_snapshot(path)
+            wh2 = Warehouse()
+            self.assertTrue(wh2.load_snapshot(path, sources))
+            self.assertDictEqual(dict(wh2.operations), dict(wh.operations))
+            self.assertDictEqual(wh2.products, wh.products)
+            self.assertDictEqual(wh2.categories, wh.categories)
+
+            self.assertFalse(Warehouse().load_snapshot(path, sources[:2] + ('./other.csv',)))
+
+            # damaged snapshots are ignored and files are parsed instead
+            for content in (b'PK\x03\x04' + b'x' * 100, None):
+                if content is None:
+                    np.savez(path, version=Warehouse.SNAPSHOT_VERSION)
+                else:
+                    with open(path, 'wb') as f:
+                        f.write(content)
+                wh3 = Warehouse()
+                self.assertFalse(wh3.load_snapshot(path, sources))
+                self.assertEqual(len(wh3.product_list), 0)
+                wh3.load(*sources, snapshot=path)
+                self.assertDictEqual(dict(wh3.operations), dict(wh.operations))
+
+            # snapshot which can't be written doesn't prevent loading
+            wh3 = Warehouse()
+            wh3.load(*sources, snapshot=os.path.join(path, 'warehouse.npz'))
+            self.assertDictEqual(dict(wh3.operations), dict(wh.operations))
+            self.assertListEqual(os.listdir(tmp), ['warehouse.npz'])
+
+    def test_refresh(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'operations.csv')
+            with open('./operations_test.csv', 'rb') as src, open(path, 'wb') as dst:
+                dst.write(src.read())
+
+            wh2 = Warehouse()
+            wh2.load('./categories_test.csv', './products_test.csv', path)
+            self.assertEqual(wh2.refresh(), 0)
+
+            with open(path, 'ab') as f:
+                f.write(b'1001;2021-06-01;SALE;BHaP01MWhi;3;110;\n1002;2021-06-02;RES')
+            self.assertEqual(wh2.refresh(), 1)
+            self.assertEqual(wh2.last_operation_id, 1001)
+            self.assertEqual(stock_status_for_product(wh2.products['BHaP01MWhi'], wh2),
+                             stock_status_for_product(wh.products['BHaP01MWhi'], wh) - 3)
+
+            with open(path, 'ab') as f:
+                f.write(b'UPPLY;BHaP01MWhi;5;60;\n')
+            self.assertEqual(wh2.refresh(), 1)
+            self.assertEqual(len(wh2.operations), len(wh.operations) + 2)
+            self.assertEqual(get_resupply(date(2021, 6, 1), date(2021, 7, 1), wh2), 5)
+
+            # blank lines don't make next refresh load file again
+            with open(path, 'ab') as f:
+                f.write(b'1003;2021-06-03;SALE;BHaP01MWhi;1;110;\n\n')
+            self.assertEqual(wh2.refresh(), 1)
+            with open(path, 'ab') as f:
+                f.write(b'1004;2021-06-04;SALE;BHaP01MWhi;1;110;\n')
+            with patch.object(wh2, '_reload', side_effect=AssertionError):
+                self.assertEqual(wh2.refresh(), 1)
+
+            # rewritten file is loaded again, only operations which weren't loaded are new
+            with open(path, 'ab') as f:
+                f.write(b'1005;2021-06-05;SALE;BHaP01MWhi;1;110;\n1000;2021-06-05;SALE;BHaP01MWhi;1;110;\n')
+            self.assertEqual(wh2.refresh(), 2)
+            self.assertEqual(len(wh2.operations), len(wh.operations) + 6)
+
+            # snapshot continues refresh() after rows which were parsed
+            snapshot = os.path.join(tmp, 'warehouse.npz')
+            wh2.save_snapshot(snapshot)
+            wh3 = Warehouse()
+            self.assertTrue(wh3.load_snapshot(snapshot))
+            self.assertEqual(wh3.refresh(), 0)
+            self.assertEqual(wh3.last_operation_id, wh2.last_operation_id)
+
+            # row appended after parsing, but before saving snapshot, makes it stale and is loaded by refresh()
+            def append_and_save(snapshot_path):
+                with open(path, 'ab') as f:
+                    f.write(b'2000;2021-07-01;SALE;BHaP01MWhi;1;110;\n')
+                Warehouse.save_snapshot(wh3, snapshot_path)
+
+            snapshot = os.path.join(tmp, 'appended.npz')
+            wh3 = Warehouse()
+            with patch.object(wh3, 'save_snapshot', side_effect=append_and_save):
+                wh3.load('./categories_test.csv', './products_test.csv', path, snapshot=snapshot)
+            self.assertFalse(Warehouse().load_snapshot(snapshot))
+            self.assertEqual(wh3.refresh(), 1)
+            self.assertIn(2000, wh3.operations)
+
+
+class PredictionsTests(unittest.TestCase):
+    def test_products_prediction(self):
+        names = [prod.id for prod in wh.product_list]
+        for monthly in (True, False):
+            for additive in (True, False):
+                result = products_prediction(wh, names, False, monthly, additive)
+                for i, name in enumerate(names):
+                    prediction = counting_prediction(wh, name, False, monthly, additive)
+                    self.assertListEqual(result.labels, list(prediction))
+                    np.testing.assert_allclose(result.prediction[i], list(prediction.values()))
+                    np.testing.assert_allclose(result.trend[i], linear_trend_parameters(wh, name, False, monthly))
+                    np.testing.assert_allclose(result.indicators[i], list(cleaning_indicators(wh, name, False, monthly, additive).values()))
+
+
+    def test_seasonal_decomposition(self):
+        decomposition = seasonal_decomposition(wh, 'BHaP05MGry', True, True, True)
+        self.assertDictEqual(decomposition.sales, sales_sum(wh, 'BHaP05MGry', True, True))
+        self.assertListEqual(decomposition.trend, linear_trend_parameters(wh, 'BHaP05MGry', True, True))
+        self.assertDictEqual(decomposition.first_indicators, seasonal_indicators_intro(wh, 'BHaP05MGry', True, True, True))
+        self.assertDictEqual(decomposition.indicators, cleaning_indicators(wh, 'BHaP05MGry', True, True, True))
+        self.assertDictEqual(decomposition.prediction, counting_prediction(wh, 'BHaP05MGry', True, True, True))
+
+        with patch('storage.predictions.period_sums', side_effect=AssertionError):
+            self.assertEqual(seasonal_decomposition(wh, 'BHaP05MGry', True, True, True), decomposition)
+            counting_prediction(wh, 'BHaP05MGry', True, True, True)['1_20'] = -1
+            seasonal_decomposition(wh, 'BHaP05MGry', True, True, True).prediction.clear()
+            self.assertDictEqual(counting_prediction(wh, 'BHaP05MGry', True, True, True), decomposition.prediction)
+
+
+    def test_sales_sum(self):
+        sales = sales_sum(wh, 'BHaP05MGry', True, False)
+        self.assertListEqual(list(sales)[:3], ['III_14', 'IV_14', 'I_15'])
+        self.assertEqual(sales['I_15'], sum(op.quantity for op in only_sales_for_product(wh, 'BHaP05MGry')
+                                             if op.date.year == 2015 and op.date.month <= 3))
+
+        # operations in reversed order
+        wh2 = make_warehouse(wh, slice(None, None, -1))
+        for monthly in (True, False):
+            self.assertDictEqual(sales_sum(wh2, None, True, monthly), sales_sum(wh, None, True, monthly))
+            np.testing.assert_allclose(list(sales_sum(wh2, None, False, monthly).values()), list(sales_sum(wh, None, False, monthly).values()))
+
+
+    def test_backtest(self):
+        series = backtest_series(wh)
+        self.assertEqual(series[wh.products['BIrM02MBla']][1], 0)
+        self.assertEqual(sum(series[wh.products['BHaP05MGry']][0]), get_sales(date(2010, 1, 1), date(2030, 1, 1), wh, id_prefixes=['BHaP05MGry']))
+
+        with tempfile.TemporaryDirectory() as tmp, patch('storage.backtesting.forecast_cache', DiskCache(tmp)):
+            scores = backtest(wh, horizon=3, min_train=36, step=6, models=('additive', 'multiplicative'), workers=1)
+            self.assertEqual(scores['additive'].forecasts, sum(len(range(36, len(values), 6)) for values, _ in series.values()))
+            self.assertEqual(len(scores['multiplicative'].mae), 3)
+            with patch('storage.backtesting.matrix_prediction', side_effect=AssertionError):
+                self.assertEqual(backtest(wh, horizon=3, min_train=36, step=6, models=('additive', 'multiplicative'), workers=1), scores)
+            with patch('storage.analysis.forecast_values', return_value=[1., 1., 1.]) as mock:
+                backtest(wh, horizon=3, min_train=36, step=6, models=('sarimax',), workers=1)
+                self.assertFalse(mock.call_args.kwargs['use_cache'])
+            with patch('storage.analysis.forecast_values', side_effect=FitTimeout) as mock:
+                scores = backtest(wh, horizon=3, min_train=36, step=6, models=('sarimax',), workers=1, time_limit=5)
+                self.assertEqual(mock.call_args[0][3], 5)
+                self.assertEqual(scores['sarimax'].failures, sum(len(range(36, len(values), 6)) for values, _ in series.values()))
+        self.assertRaises(ValueError, backtest, wh, horizon=13)
+
+
+    def test_online_forecaster(self):
+        for additive in (True, False):
+            forecaster = OnlineForecaster.from_warehouse(wh, 'BHaP05MGry', True, True)
+            np.testing.assert_allclose(forecaster.trend_parameters(), linear_trend_parameters(wh, 'BHaP05MGry', True, True))
+            np.testing.assert_allclose(list(forecaster.cleaning_indicators(additive).values()),
+                                       list(cleaning_indicators(wh, 'BHaP05MGry', True, True, additive).values()))
+            prediction = counting_prediction(wh, 'BHaP05MGry', True, True, additive)
+            self.assertListEqual(list(forecaster.prediction(additive)), list(prediction))
+            np.testing.assert_allclose(list(forecaster.prediction(additive).values()), list(prediction.values()))
+
+        # state built period by period with correction of last period
+        sales = list(sales_sum(wh, None, False, False).values())
+        forecaster = OnlineForecaster(OnlineForecaster.from_warehouse(wh, None, False, False).first_period, False)
+        for y in sales:
+            forecaster.add(0)
+            forecaster.update(y)
+        np.testing.assert_allclose(forecaster.trend_parameters(), linear_trend_parameters(wh, None, False, False))
+        np.testing.assert_allclose(list(forecaster.prediction(True).values()), list(counting_prediction(wh, None, False, False, True).values()))
 
 
 if __name__ == '__main__':